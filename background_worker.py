@@ -0,0 +1,99 @@
+import os
+import time
+import asyncio
+import logging
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Отложенная обработка сообщений: сразу отвечаем "обрабатываю…", результат дописываем позже
+DEFERRED_PARSING = os.getenv("DEFERRED_PARSING", "0") == "1"
+DEFERRED_QUEUE_SIZE = int(os.getenv("DEFERRED_QUEUE_SIZE", "1000"))
+DEFERRED_WORKERS = int(os.getenv("DEFERRED_WORKERS", "8"))
+
+PROCESSING_TEXT = "Обрабатываю…"
+ERROR_TEXT = "Произошла ошибка при обработке запроса. Пожалуйста, попробуйте снова."
+
+
+class BackgroundWorker:
+    """Ограниченная очередь задач с пулом обработчиков.
+
+    Задача - асинхронная функция без аргументов, возвращающая текст ответа;
+    по готовности этим текстом редактируется заранее отправленное сообщение.
+    """
+
+    def __init__(self, max_size=DEFERRED_QUEUE_SIZE, workers=DEFERRED_WORKERS):
+        self.max_size = max_size
+        self.workers = workers
+        self._queue = None
+        self._tasks = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Background worker started: {self.workers} workers, queue size {self.max_size}")
+
+    async def stop(self) -> None:
+        """Дожидается обработки уже поставленных задач и останавливает обработчики."""
+        if not self.running:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job, reply_message) -> bool:
+        """Ставит задачу в очередь. Возвращает False, если очередь заполнена."""
+        try:
+            self._queue.put_nowait((time.monotonic(), job, reply_message))
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _work(self) -> None:
+        while True:
+            enqueued_at, job, reply_message = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                text = await job()
+                self.processed += 1
+            except Exception as e:
+                logger.error(f"Background job failed: {e}")
+                self.failed += 1
+                text = ERROR_TEXT
+            try:
+                await reply_message.edit_text(text)
+            except TelegramError as e:
+                logger.warning(f"Could not edit deferred reply: {e}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Returns queue depth, wait times and job counters."""
+        started = self.processed + self.failed
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait": self.total_wait / started if started else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+background_worker = BackgroundWorker()
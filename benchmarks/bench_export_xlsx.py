@@ -0,0 +1,99 @@
+"""Сравнение XLSX-экспорта: прежний путь (pandas + load_workbook) и однопроходный write-only.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_export_xlsx --rows 50000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import datetime
+import tracemalloc
+import pandas as pd
+from openpyxl import load_workbook
+import database
+from migrations import apply_migrations
+from export_engine import render_export, EXPORT_COLUMNS
+
+USER_ID = "1"
+CATEGORIES = ["Продукты", "Транспорт", "Кафе и рестораны", "Коммуналка", "Зарплата", "Uncategorized"]
+CURRENCIES = ["UAH", "USD", "EUR"]
+
+
+def fill_database(conn, rows) -> None:
+    start = datetime.date(2020, 1, 1)
+    conn.executemany(
+        'INSERT INTO transactions (user_id, amount, date, category, currency) VALUES (?, ?, ?, ?, ?)',
+        (
+            (
+                USER_ID,
+                random.randint(-5000, 5000),
+                (start + datetime.timedelta(days=random.randint(0, 2000))).isoformat(),
+                random.choice(CATEGORIES),
+                random.choice(CURRENCIES),
+            )
+            for _ in range(rows)
+        )
+    )
+    conn.commit()
+
+
+def legacy_export(conn, file_path) -> None:
+    """Прежняя реализация из command_export.button_handler3."""
+    transactions = conn.execute(
+        'SELECT date, amount, category, currency FROM transactions WHERE user_id = ?', (USER_ID,)
+    ).fetchall()
+    df = pd.DataFrame(transactions, columns=EXPORT_COLUMNS)
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
+    df.sort_values(by='Date', inplace=True)
+    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+    df.to_excel(file_path, index=False)
+
+    workbook = load_workbook(file_path)
+    worksheet = workbook.active
+    for column in worksheet.columns:
+        column = list(column)
+        max_length = max(len(str(cell.value)) for cell in column)
+        worksheet.column_dimensions[column[0].column_letter].width = max_length + 2
+    workbook.save(file_path)
+    with open(file_path, 'rb') as file:
+        file.read()
+
+
+def streaming_export(conn) -> None:
+    with render_export(conn, USER_ID, 'xlsx') as buffer:
+        buffer.read()
+
+
+def measure(fn, *args) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peak_mib": round(peak / 1024 / 1024, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = database.connect(os.path.join(tmp, "bench.db"))
+        apply_migrations(conn)
+        fill_database(conn, args.rows)
+
+        legacy = measure(legacy_export, conn, os.path.join(tmp, "legacy.xlsx"))
+        streaming = measure(streaming_export, conn)
+        conn.close()
+
+    print(f"rows: {args.rows}")
+    print(f"legacy (pandas + load_workbook): {legacy}")
+    print(f"write-only streaming:            {streaming}")
+
+
+if __name__ == "__main__":
+    main()
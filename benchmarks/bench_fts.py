@@ -0,0 +1,96 @@
+"""Полнотекстовый поиск по исходным сообщениям: построение индекса FTS5 и запросы MATCH против LIKE.
+
+Пользователь "1" получает долю строк --heavy-share, остальные строки делят прочие пользователи,
+поэтому запросы сравниваются и для пользователя с длинной историей, и для обычного.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fts --rows 500000 --users 2000 --heavy-share 0.2
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import datetime
+import database
+from migrations import apply_migrations
+from transaction_search import MATCH_CONDITION, LIKE_CONDITION, build_match_query, build_like_patterns
+
+WORDS = [
+    "купил", "продукты", "в", "Ашане", "Сильпо", "АТБ", "кофе", "такси", "Uber", "обед", "ужин",
+    "коммуналка", "за", "квартиру", "интернет", "бензин", "на", "заправке", "OKKO", "подарок", "маме",
+    "аптека", "лекарства", "зарплата", "премия", "кино", "билеты", "McDonald's", "хлеб", "молоко",
+]
+CATEGORIES = ["Продукты", "Транспорт", "Кафе и рестораны", "Коммуналка", "Зарплата", "Uncategorized"]
+QUERIES = ["Ашан", "кофе", "продукты Сильпо", "заправке бензин"]
+
+
+def fill_database(conn, rows, users, heavy_share) -> None:
+    start = datetime.date(2020, 1, 1)
+    conn.executemany(
+        'INSERT INTO transactions (user_id, amount, date, category, currency, message) VALUES (?, ?, ?, ?, ?, ?)',
+        (
+            (
+                "1" if random.random() < heavy_share else str(random.randint(2, users)),
+                random.randint(-5000, 5000),
+                (start + datetime.timedelta(days=random.randint(0, 2000))).isoformat(),
+                random.choice(CATEGORIES),
+                "UAH",
+                f"{' '.join(random.sample(WORDS, random.randint(2, 6)))} {random.randint(10, 5000)}",
+            )
+            for _ in range(rows)
+        )
+    )
+    conn.commit()
+
+
+def timed(fn, repeat=1) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--heavy-share", type=float, default=0.2, help="доля строк пользователя 1")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = database.connect(os.path.join(tmp, "bench.db"))
+        apply_migrations(conn)
+
+        started = time.perf_counter()
+        fill_database(conn, args.rows, args.users, args.heavy_share)
+        insert_seconds = time.perf_counter() - started
+
+        # Полная перестройка индекса - то же, что делает первичное заполнение после миграции
+        rebuild_seconds = timed(lambda: (
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')"), conn.commit()
+        ))
+
+        print(f"rows: {args.rows}, users: {args.users}, heavy share: {args.heavy_share}")
+        print(f"insert with FTS triggers: {insert_seconds:.3f}s")
+        print(f"index rebuild:            {rebuild_seconds:.3f}s")
+        for user_id in ("1", "2"):
+            (user_rows,) = conn.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ?', (user_id,)).fetchone()
+            print(f"user {user_id}: {user_rows} rows")
+            for text in QUERIES:
+                match = timed(lambda: conn.execute(
+                    f'SELECT COUNT(*) FROM transactions WHERE user_id = ? AND {MATCH_CONDITION}',
+                    (user_id, build_match_query(user_id, text))
+                ).fetchone(), args.repeat)
+                patterns = build_like_patterns(text)
+                like_sql = ' AND '.join([LIKE_CONDITION] * len(patterns))
+                like = timed(lambda: conn.execute(
+                    f'SELECT COUNT(*) FROM transactions WHERE user_id = ? AND {like_sql}', (user_id, *patterns)
+                ).fetchone(), args.repeat)
+                print(f"  {text!r:22} MATCH {match * 1000:8.2f} ms   LIKE {like * 1000:8.2f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
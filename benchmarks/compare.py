@@ -0,0 +1,66 @@
+"""Сравнение двух файлов результатов benchmarks.run_benchmarks.
+
+Запуск из корня репозитория:
+    python -m benchmarks.compare base.json new.json --threshold 1.2
+
+Код выхода 1, если медиана какого-либо бенчмарка выросла больше чем в threshold раз.
+"""
+import sys
+import json
+import argparse
+
+
+def load(path) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(base, new, threshold, metric="median_ms") -> list:
+    """Возвращает имена бенчмарков с регрессией и печатает таблицу сравнения."""
+    regressions = []
+    print(f"{'benchmark':36} {'base':>12} {'new':>12} {'ratio':>8}")
+    for name in sorted(set(base["results"]) | set(new["results"])):
+        old_result = base["results"].get(name)
+        new_result = new["results"].get(name)
+        if old_result is None or new_result is None:
+            print(f"{name:36} {'-' if old_result is None else old_result[metric]:>12} "
+                  f"{'-' if new_result is None else new_result[metric]:>12}")
+            continue
+        ratio = new_result[metric] / old_result[metric] if old_result[metric] else 1.0
+        mark = ""
+        if ratio > threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            mark = "  faster"
+        print(f"{name:36} {old_result[metric]:>12.3f} {new_result[metric]:>12.3f} {ratio:>8.2f}{mark}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.2, help="допустимое отношение new / base")
+    parser.add_argument("--metric", default="median_ms", choices=["min_ms", "median_ms", "p95_ms", "mean_ms"])
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    for label, report in (("base", base), ("new", new)):
+        meta = report.get("meta", {})
+        print(f"{label}: commit {meta.get('commit')}, dataset {meta.get('dataset')}")
+    datasets = [
+        {key: value for key, value in report.get("meta", {}).get("dataset", {}).items() if key != "seconds"}
+        for report in (base, new)
+    ]
+    if datasets[0] != datasets[1]:
+        print("Warning: results were measured on different datasets")
+
+    regressions = compare(base, new, args.threshold, args.metric)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
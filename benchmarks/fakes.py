@@ -0,0 +1,150 @@
+"""Поддельные объекты Telegram и OpenAI для вызова обработчиков бота без сети.
+
+Реализовано только то, к чему обращаются обработчики; ответы сохраняются для проверки.
+"""
+import json
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+_message_ids = itertools.count(1)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+        self.edited = 0
+        self.documents = 0
+        self.document_bytes = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+        return FakeMessage(text, chat_id=chat_id, bot=self)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.edited += 1
+        return True
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        self.documents += 1
+        if isinstance(document, str):
+            file_id = document
+        else:
+            # Как при загрузке в Telegram: файл читается целиком
+            self.document_bytes += len(document.read())
+            file_id = f"file-{next(_message_ids)}"
+        message = FakeMessage(None, chat_id=chat_id, bot=self)
+        message.document = SimpleNamespace(file_id=file_id)
+        return message
+
+
+class FakeMessage:
+    def __init__(self, text, user_id=None, chat_id=None, bot=None):
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.from_user = SimpleNamespace(id=int(user_id)) if user_id is not None else None
+        self.chat_id = chat_id
+        self.bot = bot
+        self.document = None
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return FakeMessage(text, chat_id=self.chat_id, bot=self.bot)
+
+    async def edit_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, user_id, message):
+        self.data = data
+        self.from_user = SimpleNamespace(id=int(user_id))
+        self.message = message
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+        return True
+
+
+class FakeChat:
+    def __init__(self, chat_id, bot):
+        self.id = int(chat_id)
+        self.bot = bot
+
+    async def send_message(self, text, **kwargs):
+        return await self.bot.send_message(self.id, text, **kwargs)
+
+
+class FakeApplication:
+    """Собирает фоновые задачи, которые обработчики создают через application.create_task."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.tasks = []
+
+    def create_task(self, coroutine, *args, **kwargs):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+    async def wait_tasks(self) -> None:
+        while self.tasks:
+            tasks, self.tasks = self.tasks, []
+            await asyncio.gather(*tasks)
+
+
+class FakeContext:
+    def __init__(self, bot, application=None, user_data=None):
+        self.bot = bot
+        self.application = application or FakeApplication(bot)
+        self.user_data = user_data if user_data is not None else {}
+
+
+def message_update(bot, user_id, text):
+    message = FakeMessage(text, user_id=user_id, chat_id=user_id, bot=bot)
+    return SimpleNamespace(
+        message=message,
+        callback_query=None,
+        effective_user=message.from_user,
+        effective_chat=FakeChat(user_id, bot),
+    )
+
+
+def callback_update(bot, user_id, data):
+    message = FakeMessage(None, chat_id=user_id, bot=bot)
+    query = FakeCallbackQuery(data, user_id, message)
+    return SimpleNamespace(
+        message=None,
+        callback_query=query,
+        effective_user=query.from_user,
+        effective_chat=FakeChat(user_id, bot),
+    )
+
+
+class FakeLLM:
+    """Замена llm_client.complete: отвечает готовым JSON извлечения без обращения к API."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def complete(self, messages, **kwargs) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = messages[-1]["content"]
+        transaction = {"balance_change": -100, "date": None, "category": "Uncategorized", "currency": None}
+        if content.startswith("["):
+            items = json.loads(content)
+            return json.dumps({"results": [
+                {"id": item["id"], "is_financial": True, "language": "ru", "transactions": [transaction]}
+                for item in items
+            ]})
+        return json.dumps({"is_financial": True, "language": "ru", "transactions": [transaction]})
+
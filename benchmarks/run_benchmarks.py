@@ -0,0 +1,266 @@
+"""Бенчмарки обработчиков бота на синтетической базе данных.
+
+Вызываются настоящие обработчики с поддельными объектами Telegram и OpenAI (benchmarks.fakes).
+Результаты сохраняются в JSON для сравнения между коммитами (python -m benchmarks.compare).
+
+Запуск из корня репозитория:
+    python -m benchmarks.run_benchmarks --users 1000 --transactions 200000 --output bench.json
+    python -m benchmarks.run_benchmarks --db bench_user_info.db --reuse --output bench.json
+
+Бенчмарки пишут в базу (транзакции, рассылки), поэтому используйте отдельный файл, а не рабочий user_info.db.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+from benchmarks import fakes
+from benchmarks.synthetic_data import generate
+
+
+def summarize(timings) -> dict:
+    timings = sorted(timings)
+    return {
+        "n": len(timings),
+        "min_ms": round(timings[0] * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    def __init__(self, repeat, only=None):
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    async def measure(self, name, run, repeat=None, setup=None, check=None) -> None:
+        """run - асинхронная функция без аргументов; setup готовит состояние перед каждым запуском
+        и не входит в замер; check проверяет, что обработчик отработал без ошибки."""
+        if self.only and not any(name.startswith(prefix) for prefix in self.only):
+            return
+        timings = []
+        for i in range(-1, repeat or self.repeat):  # первый запуск - прогрев
+            state = setup() if setup else None
+            started = time.perf_counter()
+            result = await (run(state) if setup else run())
+            elapsed = time.perf_counter() - started
+            if check is not None and not check(state if setup else result):
+                raise RuntimeError(f"Benchmark {name} did not produce the expected result")
+            if i >= 0:
+                timings.append(elapsed)
+        self.results[name] = summarize(timings)
+        print(f"{name:36} median {self.results[name]['median_ms']:10.3f} ms   p95 {self.results[name]['p95_ms']:10.3f} ms")
+
+
+def pick_users(db_file):
+    """Самый активный пользователь и пользователь с медианным числом транзакций."""
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute('SELECT user_id, revision FROM data_revisions ORDER BY revision DESC').fetchall()
+    finally:
+        conn.close()
+    return {"heavy": rows[0][0], "typical": rows[len(rows) // 2][0]}, {"heavy": rows[0][1], "typical": rows[len(rows) // 2][1]}
+
+
+async def run_benchmarks(runner, users, export_dir) -> None:
+    # Модули обработчиков импортируются после настройки базы и каталога кэша экспорта
+    import database
+    import main
+    import command_export
+    import broadcast_jobs
+    import transaction_extraction
+    from command_report import handle_report_date_range
+    from command_edit import process_filter, button_handler2
+    from command_export import button_handler3
+    from command_broadcast import broadcast_message
+    from export_cache import ExportCache
+    from user_profiles import profiles
+    from transaction_buffer import transaction_buffer
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot = fakes.FakeBot()
+    today = datetime.date.today()
+    year_ago = today - datetime.timedelta(days=365)
+
+    # /report за последний год
+    for kind, user_id in users.items():
+        await runner.measure(
+            f"report.{kind}",
+            lambda update: handle_report_date_range(update, fakes.FakeContext(bot)),
+            setup=lambda user_id=user_id: fakes.message_update(bot, user_id, f"{year_ago} - {today}"),
+            check=lambda update: bool(update.message.replies),
+        )
+
+    # /edit: фильтры и переход на следующую страницу
+    user_id = users["heavy"]
+    filters = {
+        "date_range": f"{today - datetime.timedelta(days=30)} - {today}",
+        "amount_range": "-500 - -100",
+        "category": "Продукты",
+        "text": "Сильпо",
+    }
+    for kind, text in filters.items():
+        await runner.measure(
+            f"process_filter.{kind}",
+            lambda state: process_filter(*state),
+            setup=lambda text=text: (fakes.message_update(bot, user_id, text), fakes.FakeContext(bot)),
+            check=lambda state: bool(state[0].message.replies),
+        )
+
+    async def next_page(state):
+        update, context = state
+        await button_handler2(update, context)
+
+    context = fakes.FakeContext(bot)
+    await process_filter(fakes.message_update(bot, user_id, filters["date_range"]), context)
+    await runner.measure(
+        "edit.next_page",
+        next_page,
+        setup=lambda: (fakes.callback_update(bot, user_id, "tx_page_next"), context),
+        check=lambda state: bool(state[0].callback_query.edits),
+    )
+
+    # /export: без кэша (рендер из базы) и повторная отправка по file_id
+    for export_format in ("csv", "json", "xlsx"):
+        def cold_setup(export_format=export_format):
+            command_export.export_cache = ExportCache(directory=tempfile.mkdtemp(dir=export_dir))
+            return fakes.callback_update(bot, user_id, export_format), bot.documents
+
+        await runner.measure(
+            f"export.{export_format}.cold",
+            lambda state: button_handler3(state[0], fakes.FakeContext(bot)),
+            setup=cold_setup,
+            check=lambda state: bot.documents > state[1],
+            repeat=max(1, runner.repeat // 4),
+        )
+        await runner.measure(
+            f"export.{export_format}.warm",
+            lambda state: button_handler3(state[0], fakes.FakeContext(bot)),
+            setup=lambda export_format=export_format: (fakes.callback_update(bot, user_id, export_format), bot.documents),
+            check=lambda state: bot.documents > state[1],
+        )
+
+    # Профиль пользователя: чтение из базы и из кэша
+    await runner.measure(
+        "get_user_data.cold",
+        lambda state: main.get_user_data(state),
+        setup=lambda: profiles.invalidate(users["typical"]) or users["typical"],
+        check=lambda state: True,
+    )
+    await runner.measure("get_user_data.warm", lambda: main.get_user_data(users["typical"]))
+
+    # Запись транзакций: 1000 одновременных save_transaction с групповой фиксацией
+    async def save_many():
+        await asyncio.gather(*(
+            main.save_transaction(users["typical"], -100, today.isoformat(), "Продукты", "UAH", "бенчмарк")
+            for _ in range(1000)
+        ))
+        await transaction_buffer.flush()
+
+    await runner.measure("save_transaction.x1000", save_many, repeat=max(1, runner.repeat // 4))
+
+    # Сообщение о расходе через ИИ (поддельный клиент OpenAI); текст каждый раз новый, чтобы не попадать в кэш
+    llm = fakes.FakeLLM()
+    transaction_extraction.complete = llm.complete
+    counter = iter(range(10 ** 9))
+
+    async def expense_message():
+        await main.handle_expense_message(users["typical"], f"обед с коллегами {next(counter)} гривен")
+        await transaction_buffer.flush()
+
+    await runner.measure("handle_expense_message.llm", expense_message)
+
+    # Рассылка всем пользователям; ограничение частоты Telegram отключено
+    broadcast_jobs.broadcast_limiter = broadcast_jobs.RateLimiter(rate=10 ** 9, burst=10 ** 9, per_chat_interval=0)
+    admin_id = users["typical"]
+
+    async def broadcast(state):
+        update, context = state
+        await broadcast_message(update, context)
+        await context.application.wait_tasks()
+
+    await runner.measure(
+        "broadcast_message.all_users",
+        broadcast,
+        setup=lambda: (fakes.message_update(bot, admin_id, "Бенчмарк рассылки"), fakes.FakeContext(bot)),
+        check=lambda state: not state[0].message.replies,
+        repeat=1,
+    )
+
+    await transaction_buffer.close()
+    await database.close_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="файл синтетической базы (по умолчанию временный)")
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать базу, если файл уже есть")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=200000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", action="append", help="запустить только бенчмарки с этим префиксом имени")
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db or os.path.join(tmp, "bench_user_info.db")
+        dataset = None
+        if not (args.reuse and os.path.exists(db_file)):
+            print(f"Generating {db_file}: {args.users} users, {args.transactions} transactions")
+            dataset = generate(db_file, args.users, args.transactions, args.skew)
+
+        # Настройки окружения должны быть заданы до импорта модулей бота
+        os.environ["DB_PATH"] = db_file
+        os.environ["EXPORT_CACHE_DIR"] = os.path.join(tmp, "export_cache")
+        os.environ["EXTRACTION_CACHE_DB"] = ""
+        os.environ["DEFERRED_PARSING"] = "0"
+        import database
+        database.configure(db_file)
+
+        users, user_transactions = pick_users(db_file)
+        runner = Runner(args.repeat, args.only)
+        asyncio.run(run_benchmarks(runner, users, tmp))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "dataset": dataset or {"db": db_file, "reused": True},
+            "users": users,
+            "user_transactions": user_transactions,
+        },
+        "results": runner.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Генератор синтетической базы user_info.db для бенчмарков.
+
+Распределения приближены к реальным: у немногих пользователей большая часть транзакций
+(закон Ципфа, параметр --skew), свежие даты встречаются чаще старых, категории и валюты
+неравномерны, у части транзакций есть исходный текст сообщения.
+
+Запуск из корня репозитория:
+    python -m benchmarks.synthetic_data --db bench.db --users 100000 --transactions 10000000
+"""
+import json
+import time
+import random
+import bisect
+import argparse
+import datetime
+import itertools
+import database
+from migrations import apply_migrations
+
+CATEGORIES = [
+    ("Продукты", 30), ("Кафе и рестораны", 15), ("Транспорт", 12), ("Коммуналка", 6), ("Развлечения", 6),
+    ("Одежда", 4), ("Здоровье", 4), ("Подарки", 2), ("Зарплата", 3), ("Uncategorized", 8),
+]
+INCOME_CATEGORIES = {"Зарплата"}
+CURRENCIES = [("UAH", 80), ("USD", 12), ("EUR", 6), ("PLN", 2)]
+MERCHANTS = ["Сильпо", "АТБ", "Ашан", "Novus", "Uber", "Bolt", "McDonald's", "Аптека АНЦ", "OKKO", "Rozetka", "WOG", "Comfy"]
+
+CHUNK_SIZE = 50000
+
+
+def _weighted(choices):
+    """Функция выбора по весам на основе накопленных сумм (быстрее random.choices в цикле)."""
+    values = [value for value, _ in choices]
+    cumulative = list(itertools.accumulate(weight for _, weight in choices))
+    total = cumulative[-1]
+    return lambda rnd: values[bisect.bisect_right(cumulative, rnd.random() * total)]
+
+
+def user_id_for(index) -> str:
+    return str(100000000 + index)
+
+
+def iter_users(users, rnd):
+    pick_currency = _weighted(CURRENCIES)
+    names = [name for name, _ in CATEGORIES if name != "Uncategorized"]
+    for index in range(users):
+        categories = rnd.sample(names, rnd.randint(3, len(names)))
+        yield user_id_for(index), json.dumps(categories, ensure_ascii=False), pick_currency(rnd)
+
+
+def iter_transactions(transactions, users, skew, days, message_ratio, rnd, today):
+    # Вес пользователя с рангом r пропорционален 1 / r^skew
+    cumulative = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, users + 1)))
+    total = cumulative[-1]
+    pick_category = _weighted(CATEGORIES)
+    pick_currency = _weighted(CURRENCIES)
+    for _ in range(transactions):
+        user_index = bisect.bisect_right(cumulative, rnd.random() * total)
+        # Экспоненциальное распределение возраста: половина транзакций за последние days / 6 дней
+        age = min(int(rnd.expovariate(6 / days)), days - 1)
+        category = pick_category(rnd)
+        amount = int(rnd.lognormvariate(5, 1.1)) + 1
+        if category in INCOME_CATEGORIES:
+            amount *= 20
+        else:
+            amount = -amount
+        message = None
+        if rnd.random() < message_ratio:
+            message = f"{category.lower()} {rnd.choice(MERCHANTS)} {abs(amount)}"
+        yield (
+            user_id_for(min(user_index, users - 1)),
+            amount,
+            (today - datetime.timedelta(days=age)).isoformat(),
+            category,
+            pick_currency(rnd),
+            message,
+        )
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate(db_file, users, transactions, skew=1.1, days=1460, message_ratio=0.3, seed=42, log=print) -> dict:
+    """Создаёт базу с указанным числом пользователей и транзакций.
+
+    Триггеры transactions на время заполнения удаляются, а daily_totals, data_revisions и
+    полнотекстовый индекс строятся затем одним проходом - иначе 10M строк вставлялись бы часами.
+    Возвращает сведения о созданной базе.
+    """
+    rnd = random.Random(seed)
+    today = datetime.date.today()
+    started = time.perf_counter()
+    conn = database.connect(db_file)
+    apply_migrations(conn)
+
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'transactions'"
+    ).fetchall()
+    with conn:
+        for name, _ in triggers:
+            conn.execute(f'DROP TRIGGER {name}')
+        conn.executemany(
+            'INSERT OR REPLACE INTO user_data (user_id, categories, default_currency) VALUES (?, ?, ?)',
+            iter_users(users, rnd)
+        )
+        inserted = 0
+        for chunk in _chunks(iter_transactions(transactions, users, skew, days, message_ratio, rnd, today), CHUNK_SIZE):
+            conn.executemany(
+                'INSERT INTO transactions (user_id, amount, date, category, currency, message) VALUES (?, ?, ?, ?, ?, ?)',
+                chunk
+            )
+            inserted += len(chunk)
+            if inserted % (CHUNK_SIZE * 20) == 0:
+                log(f"  {inserted} transactions")
+
+        log("  building daily_totals, data_revisions and the full-text index")
+        conn.execute('DELETE FROM daily_totals')
+        conn.execute('''
+            INSERT INTO daily_totals (user_id, day, category, currency, income, expenses, tx_count)
+            SELECT user_id, date, IFNULL(category, ''), IFNULL(currency, ''),
+                   SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+                   SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END),
+                   COUNT(*)
+            FROM transactions
+            GROUP BY user_id, date, IFNULL(category, ''), IFNULL(currency, '')
+        ''')
+        conn.execute('''
+            INSERT OR REPLACE INTO data_revisions (user_id, revision)
+            SELECT user_id, COUNT(*) FROM transactions GROUP BY user_id
+        ''')
+        conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+        for _, sql in triggers:
+            conn.execute(sql)
+    conn.execute('ANALYZE')
+    conn.close()
+    return {
+        "users": users,
+        "transactions": transactions,
+        "skew": skew,
+        "days": days,
+        "seed": seed,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="bench_user_info.db")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=10000000)
+    parser.add_argument("--skew", type=float, default=1.1, help="параметр закона Ципфа для распределения по пользователям")
+    parser.add_argument("--days", type=int, default=1460, help="глубина истории в днях")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    info = generate(args.db, args.users, args.transactions, args.skew, args.days, seed=args.seed)
+    print(json.dumps(info, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
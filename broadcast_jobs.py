@@ -0,0 +1,234 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+from telegram.error import RetryAfter, Forbidden, BadRequest, TelegramError
+import database
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду всего и не чаще 1 сообщения в секунду в один чат
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+# Как часто обновлять сообщение с прогрессом у администратора, секунды
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+
+
+class TokenBucket:
+    """Асинхронный token bucket с возможностью глобальной паузы (для RetryAfter)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Глобальный token bucket плюс минимальный интервал между сообщениями в один чат."""
+
+    def __init__(self, rate=BROADCAST_RATE, burst=BROADCAST_BURST, per_chat_interval=BROADCAST_PER_CHAT_INTERVAL):
+        self.bucket = TokenBucket(rate, burst)
+        self.per_chat_interval = per_chat_interval
+        self._last_sent = {}
+
+    async def acquire(self, chat_id) -> None:
+        wait = self._last_sent.get(chat_id, 0.0) + self.per_chat_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self.bucket.acquire()
+        self._last_sent[chat_id] = time.monotonic()
+
+    def pause(self, seconds) -> None:
+        self.bucket.pause(seconds)
+
+    def forget(self, chat_ids) -> None:
+        for chat_id in chat_ids:
+            self._last_sent.pop(chat_id, None)
+
+
+# Общий лимитер для всех рассылок процесса
+broadcast_limiter = RateLimiter()
+
+
+def _retry_after_seconds(error) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def create_job(admin_chat_id, message) -> int:
+    def insert(conn):
+        total = conn.execute('SELECT COUNT(*) FROM user_data').fetchone()[0]
+        cursor = conn.execute(
+            'INSERT INTO broadcast_jobs (admin_chat_id, message, total, created_at) VALUES (?, ?, ?, ?)',
+            (str(admin_chat_id), message, total, datetime.datetime.now().isoformat(timespec='seconds'))
+        )
+        return cursor.lastrowid
+
+    return await database.run(insert)
+
+
+class BroadcastJob:
+    """Рассылка одного сообщения всем пользователям с сохранением прогресса в базе.
+
+    Пользователи читаются страницами по user_id (keyset). Каждая доставка записывается
+    в broadcast_deliveries, а курсор страницы - в broadcast_jobs, поэтому после перезапуска
+    рассылка продолжается с места остановки и не отправляет сообщение повторно.
+    """
+
+    def __init__(self, bot, job_id, limiter=None):
+        self.bot = bot
+        self.job_id = job_id
+        self.limiter = limiter or broadcast_limiter
+        self.semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        self.sent = 0
+        self.failed = 0
+        self.total = 0
+        self._last_progress = 0.0
+
+    async def run(self) -> None:
+        row = await database.fetchone(
+            'SELECT admin_chat_id, progress_message_id, message, last_user_id, total '
+            'FROM broadcast_jobs WHERE id = ?',
+            (self.job_id,)
+        )
+        if row is None:
+            logger.error(f"Broadcast job {self.job_id} not found")
+            return
+        admin_chat_id, progress_message_id, message, last_user_id, self.total = row
+        # Счётчики восстанавливаются по фактическим доставкам, включая сделанные после последнего курсора
+        counts = dict(await database.fetchall(
+            'SELECT status, COUNT(*) FROM broadcast_deliveries WHERE job_id = ? GROUP BY status', (self.job_id,)
+        ))
+        self.sent = counts.get('sent', 0)
+        self.failed = counts.get('failed', 0)
+        logger.info(f"Broadcast job {self.job_id}: resuming after user_id '{last_user_id}'")
+
+        while True:
+            user_ids = await self._next_page(last_user_id)
+            if not user_ids:
+                break
+            await asyncio.gather(*(self._deliver(user_id, message) for user_id in user_ids))
+            self.limiter.forget(user_ids)
+            last_user_id = user_ids[-1]
+            await database.execute(
+                'UPDATE broadcast_jobs SET last_user_id = ?, sent = ?, failed = ? WHERE id = ?',
+                (last_user_id, self.sent, self.failed, self.job_id)
+            )
+            await self._report_progress(admin_chat_id, progress_message_id)
+
+        await database.execute(
+            "UPDATE broadcast_jobs SET status = 'done', sent = ?, failed = ?, finished_at = ? WHERE id = ?",
+            (self.sent, self.failed, datetime.datetime.now().isoformat(timespec='seconds'), self.job_id)
+        )
+        logger.info(f"Broadcast job {self.job_id} finished: sent={self.sent}, failed={self.failed}")
+        await self._report_progress(admin_chat_id, progress_message_id, final=True)
+
+    async def _next_page(self, last_user_id):
+        # Пользователи, которым в этой рассылке уже что-то отправлялось, пропускаются
+        rows = await database.fetchall('''
+            SELECT u.user_id FROM user_data u
+            WHERE u.user_id > ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM broadcast_deliveries d WHERE d.job_id = ? AND d.user_id = u.user_id
+              )
+            ORDER BY u.user_id
+            LIMIT ?
+        ''', (last_user_id, self.job_id, BROADCAST_PAGE_SIZE))
+        return [user_id for (user_id,) in rows]
+
+    async def _deliver(self, user_id, message) -> None:
+        async with self.semaphore:
+            error = None
+            for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+                await self.limiter.acquire(user_id)
+                try:
+                    await self.bot.send_message(chat_id=user_id, text=message)
+                    error = None
+                    break
+                except RetryAfter as e:
+                    seconds = _retry_after_seconds(e)
+                    logger.warning(f"Flood limit hit, pausing broadcast for {seconds}s")
+                    self.limiter.pause(seconds)
+                    error = e
+                except (Forbidden, BadRequest) as e:
+                    # Бот заблокирован или чат не существует - повтор не поможет
+                    error = e
+                    break
+                except TelegramError as e:
+                    error = e
+                    await asyncio.sleep(attempt)
+
+        if error is None:
+            self.sent += 1
+            status = 'sent'
+        else:
+            self.failed += 1
+            status = 'failed'
+            logger.info(f"Не удалось отправить сообщение пользователю {user_id}: {error}")
+        await database.execute(
+            'INSERT OR REPLACE INTO broadcast_deliveries (job_id, user_id, status, error) VALUES (?, ?, ?, ?)',
+            (self.job_id, user_id, status, str(error) if error else None)
+        )
+
+    async def _report_progress(self, admin_chat_id, progress_message_id, final=False) -> None:
+        now = time.monotonic()
+        if not final and now - self._last_progress < BROADCAST_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        if final:
+            text = f"Рассылка завершена.\nДоставлено: {self.sent}\nОшибок: {self.failed}\nВсего пользователей: {self.total}"
+        else:
+            text = f"Рассылка: отправлено {self.sent + self.failed} из {self.total} (ошибок: {self.failed})"
+        try:
+            if progress_message_id and not final:
+                await self.bot.edit_message_text(chat_id=admin_chat_id, message_id=progress_message_id, text=text)
+            else:
+                await self.bot.send_message(chat_id=admin_chat_id, text=text)
+        except TelegramError as e:
+            logger.warning(f"Could not report broadcast progress: {e}")
+
+
+async def start_job(application, admin_chat_id, message) -> int:
+    """Создаёт рассылку, отправляет администратору сообщение прогресса и запускает её в фоне."""
+    job_id = await create_job(admin_chat_id, message)
+    progress = await application.bot.send_message(chat_id=admin_chat_id, text="Рассылка запущена.")
+    await database.execute(
+        'UPDATE broadcast_jobs SET progress_message_id = ? WHERE id = ?', (progress.message_id, job_id)
+    )
+    application.create_task(BroadcastJob(application.bot, job_id).run())
+    return job_id
+
+
+async def resume_jobs(application) -> None:
+    """Продолжает незавершённые рассылки после перезапуска."""
+    rows = await database.fetchall("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+    for (job_id,) in rows:
+        logger.info(f"Resuming broadcast job {job_id}")
+        application.create_task(BroadcastJob(application.bot, job_id).run())
@@ -1,6 +1,6 @@
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-import sqlite3
+from broadcast_jobs import start_job
 
 # Состояние для ConversationHandler
 BROADCAST_MESSAGE = range(1)
@@ -19,23 +19,12 @@ async def broadcast_start(update: Update, context: CallbackContext) -> int:
     return BROADCAST_MESSAGE
 
 async def broadcast_message(update: Update, context: CallbackContext) -> int:
-    """Отправляет сообщение всем пользователям."""
+    """Запускает фоновую рассылку сообщения всем пользователям."""
     message_to_send = update.message.text
 
     try:
-        conn = sqlite3.connect('user_info.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM user_data')
-        user_ids = cursor.fetchall()
-        conn.close()
-
-        for (user_id,) in user_ids:
-            try:
-                await context.bot.send_message(chat_id=user_id, text=message_to_send)
-            except Exception as e:
-                print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-
-        await update.message.reply_text("Сообщение отправлено всем пользователям.")
+        # Рассылка идёт в фоне; прогресс и итог приходят администратору отдельными сообщениями
+        await start_job(context.application, update.effective_chat.id, message_to_send)
     except Exception as e:
         await update.message.reply_text(f"Произошла ошибка при отправке сообщения: {e}")
 
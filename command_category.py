@@ -1,30 +1,13 @@
-import json
-import sqlite3
-import datetime
 from constants import NORMAL_PROCESSING, ADD_CATEGORY, DELETE_CATEGORY, EDIT_CATEGORY, EDIT_CATEGORY_NAME
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-
-
-def get_user_data(user_id):
-    conn = sqlite3.connect('user_info.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT categories FROM user_data WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        categories = json.loads(row[0]) if row[0] else []
-        return {
-            "categories": categories
-        }
-    else:
-        return {"categories": []}
+from user_profiles import get_user_data
 
 
 async def category(update: Update, context: CallbackContext) -> None:
     """Показывает список категорий и кнопки для добавления, удаления и изменения категории."""
     user_id = str(update.message.from_user.id)
-    user_data = get_user_data(user_id)
+    user_data = await get_user_data(user_id)
     categories = user_data.get("categories", [])
 
     categories_text = "\n".join(categories) if categories else "У вас пока нет категорий."
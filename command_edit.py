@@ -1,20 +1,24 @@
-import sqlite3
 import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-from constants import EDIT_FOR_FILTER, NORMAL_PROCESSING, NEW_TRANSACTION_DATA
+from constants import EDIT_FOR_FILTER, NORMAL_PROCESSING, NEW_TRANSACTION_DATA, BULK_CATEGORY, BULK_CURRENCY
 import logging
-import openai
-import os
+from llm_client import complete
+import database
+from user_profiles import get_user_data
+from local_parser import CURRENCY_ALIASES
+from transaction_extraction import UNCATEGORIZED
+from transaction_search import text_condition
+from edit_session import EditSession, start_session, get_session, end_session, format_transaction
 
 logger = logging.getLogger(__name__)
 
-# Set up OpenAI API key
-API_KEY = os.getenv("API_KEY")
-openai.api_key = API_KEY
+# Количество транзакций на одной странице списка /edit
+TRANSACTIONS_PAGE_SIZE = 10
 
 async def edit(update: Update, context: CallbackContext) -> None:
     """Handles the /edit command to prompt for text input and then list all transactions."""
+    end_session(context.user_data)
     context.user_data['state'] = EDIT_FOR_FILTER
     await update.message.reply_text(
         'Введите фильтр для поиска через запятую или тире. Например:\n'
@@ -22,7 +26,8 @@ async def edit(update: Update, context: CallbackContext) -> None:
         '"2025-02-20 - 2025-02-25",\n'
         '"Продукты, коммуналка",\n'
         '"1000 - 2000",\n'
-        '"2025-02-20 - 2025-02-25, Продукты, коммуналка, 1000 - 2000"'
+        '"2025-02-20 - 2025-02-25, Продукты, коммуналка, 1000 - 2000",\n'
+        '"продукты в Ашане" - поиск по тексту исходных сообщений'
     )
 
 async def process_filter(update: Update, context: CallbackContext) -> None:
@@ -36,18 +41,24 @@ async def process_filter(update: Update, context: CallbackContext) -> None:
     single_amount_pattern = r'^-?\d+$'
     amount_range_pattern = r'^(-?\d+)\s*[-–]\s*(-?\d+)$'
     category_pattern = r'^\w+$'
+    quoted_text_pattern = r'^"(.+)"$'
+
+    # Одиночное слово считается категорией, только если такая категория есть у пользователя,
+    # иначе оно (как и фразы из нескольких слов) ищется в тексте исходных сообщений
+    categories = (await get_user_data(user_id))["categories"]
+    known_categories = {c.lower(): c for c in categories + [UNCATEGORIZED]}
 
     # Split the user message by commas to handle multiple filters
     filters = [f.strip() for f in user_message.split(',')]
 
-    # Base query
-    query = 'SELECT id, amount, date, category, currency FROM transactions WHERE user_id = ?'
+    # Conditions shared by the COUNT query and the page queries
+    where = 'user_id = ?'
     params = [user_id]
 
     # Process each filter
     for f in filters:
         if re.match(single_date_pattern, f):
-            query += ' AND date = ?'
+            where += ' AND date = ?'
             params.append(f)
         elif re.match(date_range_pattern, f):
             # Split the string by the third hyphen
@@ -55,63 +66,127 @@ async def process_filter(update: Update, context: CallbackContext) -> None:
             if len(parts) == 2:
                 start_date, end_date = parts
                 logger.info(f"Date range extracted: start_date={start_date.strip()}, end_date={end_date.strip()}")
-                query += ' AND date BETWEEN ? AND ?'
+                where += ' AND date BETWEEN ? AND ?'
                 params.extend([start_date.strip(), end_date.strip()])  # Ensure no leading/trailing spaces
             else:
                 await update.message.reply_text("Неверный формат диапазона дат.")
                 context.user_data['state'] = NORMAL_PROCESSING
                 return
         elif re.match(single_amount_pattern, f):
-            query += ' AND amount = ?'
+            where += ' AND amount = ?'
             params.append(int(f))
         elif re.match(amount_range_pattern, f):
             start_amount, end_amount = map(int, re.match(amount_range_pattern, f).groups())
-            query += ' AND amount BETWEEN ? AND ?'
+            where += ' AND amount BETWEEN ? AND ?'
             params.extend([start_amount, end_amount])
-        elif re.match(category_pattern, f):
-            query += ' AND category = ?'
-            params.append(f)
+        elif re.match(category_pattern, f) and f.lower() in known_categories:
+            where += ' AND category = ?'
+            params.append(known_categories[f.lower()])
         else:
-            await update.message.reply_text("Вы указали неверные данные.")
-            context.user_data['state'] = NORMAL_PROCESSING
-            return
+            quoted = re.match(quoted_text_pattern, f)
+            condition = await text_condition(user_id, quoted.group(1) if quoted else f)
+            if condition is None:
+                await update.message.reply_text("Вы указали неверные данные.")
+                context.user_data['state'] = NORMAL_PROCESSING
+                return
+            where += f' AND {condition[0]}'
+            params.extend(condition[1])
+
+    context.user_data['state'] = NORMAL_PROCESSING  # Reset state after processing
 
     # Execute the query
-    conn = sqlite3.connect('user_info.db')
-    cursor = conn.cursor()
-    logger.info(f"Executing query: {query} with params: {params}")
-    cursor.execute(query, params)
-    transactions = cursor.fetchall()
-    conn.close()
-
-    # Prepare the message with buttons
-    if transactions:
-        keyboard = []
-        transaction_details_text = []  # Create a list to store transaction details as text
-        for transaction in transactions:
-            transaction_id, amount, date, category, currency = transaction
-            button_text = f"{date}: {amount} {currency} ({category})"
-            callback_data = f"transaction_{transaction_id}"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
-            # Save transaction details as text
-            context.user_data[callback_data] = f"ID: {transaction_id}, Date: {date}, Amount: {amount}, Category: {category}, Currency: {currency}"
-            transaction_details_text.append(f"ID: {transaction_id}, Date: {date}, Amount: {amount}, Category: {category}, Currency: {currency}")
-
-        # Save the text representation of transaction details in context
-        context.user_data['transaction_details_text'] = transaction_details_text
+    logger.info(f"Counting transactions: {where} with params: {params}")
+    (total,) = await database.fetchone(f'SELECT COUNT(*) FROM transactions WHERE {where}', params)
+    if not total:
+        await update.message.reply_text("У вас нет транзакций за указанный период или суммы.")
+        return
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Ваши транзакции:", reply_markup=reply_markup)
+    # Вместо полного списка храним только фильтр и границы текущей страницы
+    session = start_session(context.user_data, where, params, total)
+    text, reply_markup = await load_transaction_page(session)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def fetch_transaction_page(where, params, after=None, before=None):
+    """Возвращает одну страницу транзакций, упорядоченных по (date, id).
+
+    after/before - ключ (date, id) последней строки предыдущей или первой строки следующей страницы.
+    """
+    columns = 'SELECT id, amount, date, category, currency FROM transactions'
+    if before is not None:
+        rows = await database.fetchall(
+            f'{columns} WHERE {where} AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?',
+            [*params, *before, TRANSACTIONS_PAGE_SIZE]
+        )
+        return rows[::-1]
+    if after is not None:
+        return await database.fetchall(
+            f'{columns} WHERE {where} AND (date, id) > (?, ?) ORDER BY date, id LIMIT ?',
+            [*params, *after, TRANSACTIONS_PAGE_SIZE]
+        )
+    return await database.fetchall(
+        f'{columns} WHERE {where} ORDER BY date, id LIMIT ?',
+        [*params, TRANSACTIONS_PAGE_SIZE]
+    )
+
+async def load_transaction_page(session: EditSession, direction=None):
+    """Загружает страницу в указанном направлении и возвращает текст и клавиатуру."""
+    if direction == 'next':
+        transactions = await fetch_transaction_page(session.where, session.params, after=session.last)
+        if transactions:
+            session.page += 1
+    elif direction == 'prev':
+        transactions = await fetch_transaction_page(session.where, session.params, before=session.first)
+        if transactions:
+            session.page -= 1
     else:
-        await update.message.reply_text("У вас нет транзакций за указанный период или суммы.")
+        transactions = await fetch_transaction_page(session.where, session.params)
 
-    context.user_data['state'] = NORMAL_PROCESSING  # Reset state after processing
+    if not transactions:
+        # Страница исчезла (например, транзакции удалены) - начинаем с начала
+        session.page = 0
+        transactions = await fetch_transaction_page(session.where, session.params)
+        if not transactions:
+            return "У вас нет транзакций за указанный период или суммы.", None
+
+    keyboard = []
+    for transaction in transactions:
+        transaction_id, amount, date, category, currency = transaction
+        button_text = f"{date}: {amount} {currency} ({category})"
+        callback_data = f"transaction_{transaction_id}"
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
+    session.set_page(transactions)
+
+    pages = (session.total + TRANSACTIONS_PAGE_SIZE - 1) // TRANSACTIONS_PAGE_SIZE
+    navigation = []
+    if session.page > 0:
+        navigation.append(InlineKeyboardButton("<-", callback_data="tx_page_prev"))
+    if session.page + 1 < pages:
+        navigation.append(InlineKeyboardButton("->", callback_data="tx_page_next"))
+    if navigation:
+        keyboard.append(navigation)
+
+    # Массовые действия над всеми транзакциями, подходящими под фильтр
+    keyboard.append([
+        InlineKeyboardButton("Категория для всех", callback_data="bulk_category"),
+        InlineKeyboardButton("Валюта для всех", callback_data="bulk_currency"),
+    ])
+    keyboard.append([InlineKeyboardButton(f"Удалить все ({session.total})", callback_data="bulk_delete")])
+
+    text = f"Ваши транзакции ({session.total}), страница {session.page + 1} из {pages}:"
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def fetch_transaction(user_id, transaction_id):
+    """Читает одну транзакцию пользователя по id."""
+    return await database.fetchone(
+        'SELECT id, amount, date, category, currency FROM transactions WHERE id = ? AND user_id = ?',
+        (transaction_id, user_id)
+    )
 
 async def send_action_buttons(update: Update, context: CallbackContext) -> None:
-    """Sends action buttons if transaction details are available."""
-    transaction_details = context.user_data.get('selected_transaction')
-    
-    if transaction_details:
+    """Sends action buttons if a transaction is selected."""
+    session = get_session(context.user_data)
+
+    if session is not None and session.selected_id is not None:
         # Create buttons
         keyboard = [
             [InlineKeyboardButton("Изменить транзакцию", callback_data="edit_transaction")],
@@ -131,66 +206,89 @@ async def button_handler2(update: Update, context: CallbackContext) -> None:
     # Log the callback data
     logger.info(f"Callback data received: {query.data}")
 
-    # Directly use the saved transaction details text
-    transaction_details_text = context.user_data.get('transaction_details_text')
-    if transaction_details_text:
-        # Log the transaction details text
-        logger.info(f"Transaction details text: {transaction_details_text}")
+    user_id = str(query.from_user.id)
+    session = get_session(context.user_data)
+    if session is None:
+        logger.warning("Edit session not found.")
+        end_session(context.user_data)
+        context.user_data['state'] = NORMAL_PROCESSING
+        await query.edit_message_text(text="Детали транзакции не найдены.")
+        return
 
-        # Check which button was pressed and respond accordingly
-        if query.data == "edit_transaction":
-            selected_transaction = context.user_data.get('selected_transaction')
+    # Check which button was pressed and respond accordingly
+    if query.data in ("tx_page_prev", "tx_page_next"):
+        text, reply_markup = await load_transaction_page(session, query.data[len("tx_page_"):])
+        await query.edit_message_text(text=text, reply_markup=reply_markup)
+    elif query.data == "edit_transaction":
+        transaction = await fetch_transaction(user_id, session.selected_id) if session.selected_id else None
+        if transaction:
             context.user_data['state'] = NEW_TRANSACTION_DATA
-            await query.edit_message_text(text=f"напишите, что вы хотите изменить {selected_transaction}")
-        elif query.data == "delete_transaction":
-            selected_transaction = context.user_data.get('selected_transaction')
-            if selected_transaction:
-                transaction_id = selected_transaction.split(', ')[0].split(': ')[1]
-                conn = sqlite3.connect('user_info.db')
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-                conn.commit()
-                conn.close()
-                context.user_data['state'] = NORMAL_PROCESSING
-                await query.edit_message_text(text=f"Транзакция {selected_transaction} удалена.")
-            else:
-                await query.edit_message_text(text="Не удалось найти транзакцию для удаления.")
-        elif query.data == "back_to_transactions":
+            await query.edit_message_text(text=f"напишите, что вы хотите изменить {format_transaction(transaction)}")
+        else:
+            await query.edit_message_text(text="Не удалось найти транзакцию для изменения.")
+    elif query.data == "delete_transaction":
+        transaction = await fetch_transaction(user_id, session.selected_id) if session.selected_id else None
+        if transaction:
+            await database.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction[0], user_id))
+            session.selected_id = None
             context.user_data['state'] = NORMAL_PROCESSING
-            await query.edit_message_text(text="Вы вернулись в главное меню.")
+            await query.edit_message_text(text=f"Транзакция {format_transaction(transaction)} удалена.")
         else:
-            transaction_id = query.data.split('_')[1] if '_' in query.data else None
-            selected_transaction = next(
-                (details for details in transaction_details_text if f"ID: {transaction_id}" in details),
-                None
-            )
-            if selected_transaction:
-                context.user_data['selected_transaction'] = selected_transaction
-                context.user_data['state'] = NORMAL_PROCESSING
-                await query.edit_message_text(text=f"Транзакция выбрана: {selected_transaction}")
-                await send_action_buttons(update, context)
-            else:
-                logger.warning("Specific transaction details not found.")
-                await query.edit_message_text(text="Детали транзакции не найдены.")
-    else:
-        logger.warning("Transaction details not found.")
+            await query.edit_message_text(text="Не удалось найти транзакцию для удаления.")
+    elif query.data == "bulk_category":
+        context.user_data['state'] = BULK_CATEGORY
+        await query.edit_message_text(text=f"Введите категорию для всех найденных транзакций ({session.total}):")
+    elif query.data == "bulk_currency":
+        context.user_data['state'] = BULK_CURRENCY
+        await query.edit_message_text(text=f"Введите валюту для всех найденных транзакций ({session.total}):")
+    elif query.data == "bulk_delete":
+        keyboard = [
+            [InlineKeyboardButton(f"Да, удалить {session.total}", callback_data="bulk_delete_confirm")],
+            [InlineKeyboardButton("<- Назад", callback_data="back_to_transactions")]
+        ]
+        await query.edit_message_text(
+            text=f"Удалить все найденные транзакции ({session.total})?",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    elif query.data == "bulk_delete_confirm":
+        deleted = await database.execute(f'DELETE FROM transactions WHERE {session.where}', session.params)
+        end_session(context.user_data)
         context.user_data['state'] = NORMAL_PROCESSING
-        await query.edit_message_text(text="Детали транзакции не найдены.")
+        await query.edit_message_text(text=f"Удалено транзакций: {deleted}.")
+    elif query.data == "back_to_transactions":
+        end_session(context.user_data)
+        context.user_data['state'] = NORMAL_PROCESSING
+        await query.edit_message_text(text="Вы вернулись в главное меню.")
+    else:
+        transaction_id = int(query.data.split('_')[1])
+        transaction = await fetch_transaction(user_id, transaction_id) if session.contains(transaction_id) else None
+        if transaction:
+            session.selected_id = transaction_id
+            context.user_data['state'] = NORMAL_PROCESSING
+            await query.edit_message_text(text=f"Транзакция выбрана: {format_transaction(transaction)}")
+            await send_action_buttons(update, context)
+        else:
+            logger.warning("Specific transaction details not found.")
+            await query.edit_message_text(text="Детали транзакции не найдены.")
 
 async def process_new_transaction_data(update: Update, context: CallbackContext) -> None:
     """Processes new transaction data input by the user."""
     user_input = update.message.text
-    selected_transaction = context.user_data.get('selected_transaction')
-    transaction_id = selected_transaction.split(', ')[0].split(': ')[1]
     user_id = str(update.message.from_user.id)  # Получаем user_id
-
+    session = get_session(context.user_data)
+    transaction = None
+    if session is not None and session.selected_id is not None:
+        transaction = await fetch_transaction(user_id, session.selected_id)
+    if transaction is None:
+        end_session(context.user_data)
+        context.user_data['state'] = NORMAL_PROCESSING
+        await update.message.reply_text("Не удалось найти транзакцию для изменения.")
+        return
+    transaction_id = transaction[0]
+    selected_transaction = format_transaction(transaction)
     # Use OpenAI API to process the input
     try:
-        API_KEY = os.getenv("API_KEY")
-        openai.api_key = API_KEY
-        client = openai.OpenAI(api_key=API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        formatted_data = await complete(
             messages=[
                 {"role": "system", "content": f"""You are a helpful assistant. 
                  Format the user's transaction data for database insertion. 
@@ -200,7 +298,6 @@ async def process_new_transaction_data(update: Update, context: CallbackContext)
                 {"role": "user", "content": user_input}
             ]
         )
-        formatted_data = response.choices[0].message.content.strip()
 
         # Ensure the formatted data is in the correct format
         try:
@@ -215,16 +312,12 @@ async def process_new_transaction_data(update: Update, context: CallbackContext)
             if not date or not amount or not category or not currency:
                 raise ValueError("One of the fields is empty.")
 
-            # Delete the old transaction and insert the new one
-            conn = sqlite3.connect('user_info.db')
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-            cursor.execute(
-                "INSERT INTO transactions (id, user_id, date, amount, category, currency) VALUES (?, ?, ?, ?, ?, ?)",
-                (transaction_id, user_id, date, int(amount), category, currency)
+            # Update the transaction in place
+            await database.execute(
+                "UPDATE transactions SET date = ?, amount = ?, category = ?, currency = ? WHERE id = ? AND user_id = ?",
+                (date, int(amount), category, currency, transaction_id, user_id)
             )
-            conn.commit()
-            conn.close()
+            session.selected_id = None
             await update.message.reply_text(f"Транзакция \n\n{selected_transaction} \n\nуспешно обновлена на \n\n{formatted_data}.")
         except ValueError as ve:
             logger.error(f"Value error: {ve}")
@@ -236,3 +329,42 @@ async def process_new_transaction_data(update: Update, context: CallbackContext)
     # Reset state to NORMAL_PROCESSING
     context.user_data['state'] = NORMAL_PROCESSING
 
+async def process_bulk_value(update: Update, context: CallbackContext) -> None:
+    """Применяет новую категорию или валюту ко всем транзакциям, подходящим под фильтр /edit."""
+    user_id = str(update.message.from_user.id)
+    user_message = update.message.text.strip()
+    current_state = context.user_data.get('state')
+    context.user_data['state'] = NORMAL_PROCESSING
+
+    session = get_session(context.user_data)
+    if session is None:
+        await update.message.reply_text("Список транзакций устарел. Повторите /edit.")
+        return
+
+    if current_state == BULK_CATEGORY:
+        column = 'category'
+        categories = (await get_user_data(user_id))["categories"]
+        lookup = {c.lower(): c for c in categories + [UNCATEGORIZED]}
+        value = lookup.get(user_message.lower())
+        if value is None:
+            await update.message.reply_text(
+                f"Категория '{user_message}' не найдена. Ваши категории: {', '.join(categories) or 'нет'}."
+            )
+            return
+    else:
+        column = 'currency'
+        value = CURRENCY_ALIASES.get(user_message.lower())
+        if value is None and re.match(r'^[A-Za-z]{3}$', user_message):
+            value = user_message.upper()
+        if value is None:
+            await update.message.reply_text("Неверный формат валюты. Например: USD, EUR, UAH.")
+            return
+
+    # Одно обновление по тому же условию, что и список, в одной транзакции базы данных
+    updated = await database.execute(
+        f'UPDATE transactions SET {column} = ? WHERE {session.where}',
+        [value, *session.params]
+    )
+    end_session(context.user_data)
+    await update.message.reply_text(f"Обновлено транзакций: {updated}.")
+
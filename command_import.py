@@ -0,0 +1,57 @@
+import os
+import logging
+import tempfile
+from telegram import Update
+from telegram.ext import CallbackContext
+from constants import NORMAL_PROCESSING, IMPORT_STATEMENT
+from statement_import import import_file, detect_format, format_import_result, StatementFormatError
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API отдаёт ботам файлы размером не более 20 МБ
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+
+
+async def import_command(update: Update, context: CallbackContext) -> None:
+    """Handles the /import command: asks for a bank statement file."""
+    context.user_data['state'] = IMPORT_STATEMENT
+    await update.message.reply_text(
+        "Отправьте выписку из банка файлом .csv или .xlsx.\n"
+        "Нужны колонки с датой и суммой; описание, валюта и категория - по возможности. "
+        "Повторно загруженные строки будут пропущены."
+    )
+
+
+async def handle_import_document(update: Update, context: CallbackContext) -> None:
+    """Принимает файл выписки после команды /import."""
+    if context.user_data.get('state') != IMPORT_STATEMENT:
+        await update.message.reply_text("Чтобы загрузить выписку, сначала используйте команду /import.")
+        return
+
+    user_id = str(update.message.from_user.id)
+    document = update.message.document
+    try:
+        file_format = detect_format(document.file_name or '')
+    except StatementFormatError as e:
+        await update.message.reply_text(str(e))
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await update.message.reply_text("Файл слишком большой. Максимальный размер - 20 МБ.")
+        return
+
+    context.user_data['state'] = NORMAL_PROCESSING
+    progress = await update.message.reply_text("Импортирую выписку…")
+    fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(fd)
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        await telegram_file.download_to_drive(path)
+        stats = await import_file(user_id, path, file_format)
+        await progress.edit_text(format_import_result(stats))
+    except StatementFormatError as e:
+        await progress.edit_text(str(e))
+    except Exception as e:
+        logger.error(f"Statement import failed for {user_id}: {e}")
+        await progress.edit_text("Не удалось импортировать выписку. Проверьте формат файла.")
+    finally:
+        os.remove(path)
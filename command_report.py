@@ -1,23 +1,10 @@
-import sqlite3
-import json
 from telegram import Update
 from telegram.ext import CallbackContext
 from constants import REPORT_DATE_RANGE, NORMAL_PROCESSING
 import re
 from datetime import datetime
 from collections import defaultdict
-
-def get_user_data(user_id):
-    conn = sqlite3.connect('user_info.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT final_balance, changes FROM user_data WHERE user_id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        final_balance, changes = row
-        return {"final_balance": final_balance, "changes": json.loads(changes)}
-    else:
-        return {"final_balance": 0, "changes": []}
+import database
 
 async def report(update: Update, context: CallbackContext) -> None:
     """Отправляет пользователю запрос на ввод периода для отчета."""
@@ -49,33 +36,28 @@ async def handle_report_date_range(update: Update, context: CallbackContext) ->
                     await update.message.reply_text("неверный формат")
                     return
                 
-                # Fetch transactions from the database
+                # Fetch aggregated daily totals from the database
                 user_id = str(update.message.from_user.id)
-                conn = sqlite3.connect('user_info.db')
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT amount, category, currency FROM transactions
-                    WHERE user_id = ? AND date BETWEEN ? AND ?
-                ''', (user_id, start_date, end_date))
-                transactions = cursor.fetchall()
-                conn.close()
-                
-                # Calculate total income and expenses
-                total_income = defaultdict(float)
-                total_expenses = defaultdict(float)
-                category_totals = defaultdict(lambda: defaultdict(lambda: {'income': 0, 'expenses': 0}))
-                
-                for amount, category, currency in transactions:
-                    if amount > 0:
-                        total_income[currency] += amount
-                        category_totals[currency][category]['income'] += amount
-                    else:
-                        total_expenses[currency] += -amount
-                        category_totals[currency][category]['expenses'] += -amount
-                
+                rows = await database.fetchall('''
+                    SELECT currency, category, SUM(income), SUM(expenses) FROM daily_totals
+                    WHERE user_id = ? AND day BETWEEN ? AND ?
+                    GROUP BY currency, category
+                    ORDER BY currency, category
+                ''', (user_id, start_date.isoformat(), end_date.isoformat()))
+
+                # Итоги по валютам и категориям уже посчитаны в daily_totals
+                total_income = defaultdict(int)
+                total_expenses = defaultdict(int)
+                category_totals = defaultdict(dict)
+
+                for currency, category, income, expenses in rows:
+                    total_income[currency] += income
+                    total_expenses[currency] += expenses
+                    category_totals[currency][category] = {'income': income, 'expenses': expenses}
+
                 # Prepare the message
                 message_lines = []
-                for currency in set(total_income.keys()).union(total_expenses.keys()):
+                for currency in category_totals:
                     if total_income[currency] > 0 or total_expenses[currency] > 0:
                         message_lines.append(f"Общие доходы за период ({currency}): {total_income[currency]}")
                         message_lines.append(f"Общие расходы за период ({currency}): {total_expenses[currency]}\n")
@@ -86,8 +68,8 @@ async def handle_report_date_range(update: Update, context: CallbackContext) ->
                             if totals['expenses'] > 0:
                                 message_lines.append(f"Расходы в '{category}' ({currency}): {totals['expenses']}")
                         message_lines.append("")  # Add a blank line for separation
-                
-                message = "\n".join(message_lines)
+
+                message = "\n".join(message_lines) or "Нет транзакций за указанный период."
                 
                 await update.message.reply_text(message)
             else:
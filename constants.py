@@ -16,6 +16,9 @@ class ProcessingState(Enum):
     JSON = auto()
     REPORT_DATE_RANGE = auto()
     SET_DEFAULT_CURRENCY = auto()
+    BULK_CATEGORY = auto()
+    BULK_CURRENCY = auto()
+    IMPORT_STATEMENT = auto()
 
 # Для обратной совместимости
 NORMAL_PROCESSING = ProcessingState.NORMAL_PROCESSING
@@ -31,3 +34,6 @@ CSV = ProcessingState.CSV
 JSON = ProcessingState.JSON
 REPORT_DATE_RANGE = ProcessingState.REPORT_DATE_RANGE
 SET_DEFAULT_CURRENCY = ProcessingState.SET_DEFAULT_CURRENCY
+BULK_CATEGORY = ProcessingState.BULK_CATEGORY
+BULK_CURRENCY = ProcessingState.BULK_CURRENCY
+IMPORT_STATEMENT = ProcessingState.IMPORT_STATEMENT
@@ -0,0 +1,144 @@
+import os
+import re
+import asyncio
+import sqlite3
+import logging
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Путь к базе данных и размер пула соединений
+DB_PATH = os.getenv("DB_PATH", "user_info.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Размер страничного кэша на соединение, КиБ
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+
+_db_file = DB_PATH
+_pool_size = DB_POOL_SIZE
+_executor = None
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+
+def configure(db_file=None, pool_size=None) -> None:
+    """Задаёт путь к базе и размер пула. Существующие соединения закрываются."""
+    global _db_file, _pool_size
+    close()
+    if db_file is not None:
+        _db_file = db_file
+    if pool_size is not None:
+        _pool_size = pool_size
+
+
+def get_db_file() -> str:
+    return _db_file
+
+
+def connect(db_file=None) -> sqlite3.Connection:
+    """Открывает новое соединение с настроенными PRAGMA (для скриптов и миграций)."""
+    conn = sqlite3.connect(db_file or _db_file, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    # В режиме WAL synchronous=NORMAL безопасен и не делает fsync на каждый commit
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # Слова текста для поиска перебором: встроенные lower() и LIKE понимают только ASCII
+    conn.create_function("search_words", 1, _search_words, deterministic=True)
+    return conn
+
+
+_LATIN_WITH_DIACRITICS = re.compile('[\u00c0-\u036f]')
+_SEARCH_WORD = re.compile(r'[^\W_]+')
+
+
+def split_search_words(text) -> list:
+    """Слова текста так, как их видит токенизатор FTS5 unicode61 remove_diacritics 2:
+    буквы и цифры без учёта регистра; диакритика снимается только с латиницы ("café" -> "cafe",
+    а "й", "ё" и "ї" остаются собой)."""
+    text = text.lower()
+    if _LATIN_WITH_DIACRITICS.search(text):
+        text = ''.join(
+            ''.join(part for part in unicodedata.normalize('NFD', ch) if not unicodedata.combining(part))
+            if ch < '\u0370' else ch
+            for ch in text
+        )
+    return _SEARCH_WORD.findall(text)
+
+
+def _search_words(value):
+    # Пробел перед каждым словом: шаблон LIKE '% слово%' совпадает только с началом слова
+    return ''.join(' ' + word for word in split_search_words(value)) if isinstance(value, str) else None
+
+
+def _get_connection() -> sqlite3.Connection:
+    # Каждый поток пула держит одно долгоживущее соединение
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="db")
+    return _executor
+
+
+def _run_in_transaction(fn, args):
+    conn = _get_connection()
+    with conn:
+        return fn(conn, *args)
+
+
+async def run(fn, *args):
+    """Выполняет fn(conn, *args) в пуле потоков внутри одной транзакции.
+
+    При успешном завершении транзакция фиксируется, при исключении откатывается.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _run_in_transaction, fn, args)
+
+
+async def fetchone(query, params=()):
+    return await run(lambda conn: conn.execute(query, params).fetchone())
+
+
+async def fetchall(query, params=()):
+    return await run(lambda conn: conn.execute(query, params).fetchall())
+
+
+async def execute(query, params=()) -> int:
+    """Выполняет изменяющий запрос и возвращает количество затронутых строк."""
+    return await run(lambda conn: conn.execute(query, params).rowcount)
+
+
+async def executemany(query, seq_of_params) -> int:
+    return await run(lambda conn: conn.executemany(query, seq_of_params).rowcount)
+
+
+def close() -> None:
+    """Закрывает пул потоков и все открытые им соединения."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing database connection: {e}")
+        _connections.clear()
+
+
+async def close_pool(*_args) -> None:
+    """Асинхронная обёртка над close() для post_shutdown."""
+    await asyncio.get_running_loop().run_in_executor(None, close)
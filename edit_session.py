@@ -0,0 +1,60 @@
+from array import array
+
+SESSION_KEY = 'edit_session'
+# Ключи, которые прежние версии /edit складывали в user_data (плюс все transaction_*)
+LEGACY_KEYS = ('selected_transaction',)
+
+
+class EditSession:
+    """Состояние просмотра транзакций в /edit.
+
+    Хранит только фильтр, границы текущей страницы, id транзакций на ней и выбранный id.
+    Сами данные транзакций при необходимости читаются из базы по id.
+    """
+
+    __slots__ = ('where', 'params', 'total', 'page', 'first', 'last', 'ids', 'selected_id')
+
+    def __init__(self, where, params, total):
+        self.where = where
+        self.params = tuple(params)
+        self.total = total
+        self.page = 0
+        self.first = None  # (date, id) первой строки страницы
+        self.last = None   # (date, id) последней строки страницы
+        self.ids = array('q')
+        self.selected_id = None
+
+    def set_page(self, rows) -> None:
+        """rows - строки (id, amount, date, category, currency) текущей страницы."""
+        self.ids = array('q', (row[0] for row in rows))
+        self.first = (rows[0][2], rows[0][0])
+        self.last = (rows[-1][2], rows[-1][0])
+
+    def contains(self, transaction_id) -> bool:
+        # Страница ограничена TRANSACTIONS_PAGE_SIZE, поэтому проверка выполняется за постоянное время
+        return transaction_id in self.ids
+
+
+def start_session(user_data, where, params, total) -> EditSession:
+    end_session(user_data)
+    session = EditSession(where, params, total)
+    user_data[SESSION_KEY] = session
+    return session
+
+
+def get_session(user_data):
+    return user_data.get(SESSION_KEY)
+
+
+def end_session(user_data) -> None:
+    """Удаляет состояние /edit, включая ключи, оставленные прежними версиями."""
+    user_data.pop(SESSION_KEY, None)
+    for key in LEGACY_KEYS:
+        user_data.pop(key, None)
+    for key in [k for k in user_data if isinstance(k, str) and k.startswith('transaction_')]:
+        del user_data[key]
+
+
+def format_transaction(row) -> str:
+    transaction_id, amount, date, category, currency = row
+    return f"ID: {transaction_id}, Date: {date}, Amount: {amount}, Category: {category}, Currency: {currency}"
@@ -0,0 +1,135 @@
+import os
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Сколько file_id загруженных в Telegram файлов помнить
+EXPORT_FILE_ID_CACHE_SIZE = int(os.getenv("EXPORT_FILE_ID_CACHE_SIZE", "10000"))
+
+
+class ExportCache:
+    """Кэш готовых экспортов по ключу (user_id, формат, ревизия данных).
+
+    Файлы хранятся на диске с ограничением общего размера и вытеснением по LRU.
+    Дополнительно запоминается file_id последней загрузки в Telegram, чтобы повторная
+    отправка того же экспорта не требовала ни чтения файла, ни его загрузки.
+    Методы с файловыми операциями синхронные - вызывать их через asyncio.to_thread.
+    """
+
+    def __init__(self, directory=EXPORT_CACHE_DIR, max_bytes=EXPORT_CACHE_MAX_BYTES,
+                 max_file_ids=EXPORT_FILE_ID_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_ids = max_file_ids
+        self._lock = threading.Lock()
+        self._files = None  # имя файла -> размер, от самых старых к самым новым
+        self._total_bytes = 0
+        self._file_ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _file_name(user_id, export_format, revision) -> str:
+        return f"{user_id}_{revision}.{export_format}"
+
+    def _load_index(self) -> None:
+        if self._files is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                # Остаток прерванной записи
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._files = OrderedDict((name, size) for _, name, size in entries)
+        self._total_bytes = sum(self._files.values())
+
+    def _remove(self, name) -> None:
+        self._total_bytes -= self._files.pop(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            logger.error(f"Error removing cached export {name}: {e}")
+
+    def get_file_id(self, user_id, export_format, revision):
+        key = (user_id, export_format, revision)
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+            self.hits += 1
+        return file_id
+
+    def remember_file_id(self, user_id, export_format, revision, file_id) -> None:
+        key = (user_id, export_format, revision)
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_file_ids:
+            self._file_ids.popitem(last=False)
+
+    def forget_file_id(self, user_id, export_format, revision) -> None:
+        self._file_ids.pop((user_id, export_format, revision), None)
+
+    def get_path(self, user_id, export_format, revision):
+        """Возвращает путь к закэшированному файлу или None."""
+        with self._lock:
+            self._load_index()
+            name = self._file_name(user_id, export_format, revision)
+            if name not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(name)
+            path = os.path.join(self.directory, name)
+            try:
+                os.utime(path)
+            except OSError:
+                self._files.pop(name, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return path
+
+    def store(self, user_id, export_format, revision, buffer) -> str:
+        """Сохраняет буфер экспорта в кэш и возвращает путь к файлу.
+
+        Экспорты того же пользователя и формата с прежними ревизиями удаляются.
+        """
+        with self._lock:
+            self._load_index()
+            prefix = f"{user_id}_"
+            suffix = f".{export_format}"
+            for name in [n for n in self._files if n.startswith(prefix) and n.endswith(suffix)]:
+                self._remove(name)
+
+            name = self._file_name(user_id, export_format, revision)
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as file:
+                shutil.copyfileobj(buffer, file)
+            os.replace(tmp_path, path)
+            self._files[name] = os.path.getsize(path)
+            self._total_bytes += self._files[name]
+
+            while self._total_bytes > self.max_bytes and len(self._files) > 1:
+                self._remove(next(iter(self._files)))
+            return path
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(self._files or ()),
+            "bytes": self._total_bytes,
+            "file_ids": len(self._file_ids),
+        }
+
+
+export_cache = ExportCache()
@@ -0,0 +1,130 @@
+import os
+import io
+import csv
+import json
+import logging
+import tempfile
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+import database
+
+logger = logging.getLogger(__name__)
+
+# Размер порции строк, читаемых из курсора за раз
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+# Экспорт меньше этого размера (в байтах) целиком остаётся в памяти
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv("EXPORT_SPOOL_MAX_SIZE", str(1024 * 1024)))
+
+EXPORT_COLUMNS = ['Date', 'Amount', 'Category', 'Currency']
+
+
+def iter_transaction_chunks(conn, user_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the user's transactions in date order, chunk_size rows at a time."""
+    cursor = conn.execute(
+        'SELECT date, amount, category, currency FROM transactions WHERE user_id = ? ORDER BY date, id',
+        (user_id,)
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def write_csv(conn, user_id, buffer) -> None:
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_transaction_chunks(conn, user_id):
+        writer.writerows(rows)
+        buffer.write(text.getvalue().encode('utf-8'))
+        text.seek(0)
+        text.truncate()
+    buffer.write(text.getvalue().encode('utf-8'))
+
+
+def write_json(conn, user_id, buffer) -> None:
+    buffer.write(b'[')
+    first = True
+    for rows in iter_transaction_chunks(conn, user_id):
+        parts = [json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) for row in rows]
+        if not first:
+            buffer.write(b',')
+        buffer.write(','.join(parts).encode('utf-8'))
+        first = False
+    buffer.write(b']')
+
+
+def get_column_widths(conn, user_id) -> list:
+    """Ширина столбцов XLSX: самая длинная строка в столбце (включая заголовок) плюс 2."""
+    row = conn.execute(
+        'SELECT MAX(LENGTH(date)), MAX(LENGTH(amount)), MAX(LENGTH(category)), MAX(LENGTH(currency)) '
+        'FROM transactions WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+    return [max(len(header), length or 0) + 2 for header, length in zip(EXPORT_COLUMNS, row)]
+
+
+def write_xlsx(conn, user_id, buffer) -> None:
+    """Пишет XLSX за один проход в режиме write-only.
+
+    В write-only режиме ширины столбцов должны быть заданы до первой строки, поэтому
+    они вычисляются заранее одним агрегирующим запросом по индексу, а не обходом ячеек.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    for index, width in enumerate(get_column_widths(conn, user_id), start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+
+    worksheet.append(EXPORT_COLUMNS)
+    for rows in iter_transaction_chunks(conn, user_id):
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(buffer)
+
+
+EXPORT_WRITERS = {
+    'csv': write_csv,
+    'json': write_json,
+    'xlsx': write_xlsx,
+}
+
+
+def render_export(conn, user_id, export_format):
+    """Пишет экспорт в буфер (в памяти, при большом объёме - во временный файл).
+
+    Возвращает буфер, перемотанный в начало. Закрыть его должен вызывающий код.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
+    try:
+        EXPORT_WRITERS[export_format](conn, user_id, buffer)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def get_revision(conn, user_id) -> int:
+    row = conn.execute('SELECT revision FROM data_revisions WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def render_export_at_revision(conn, user_id, export_format):
+    """Формирует экспорт и возвращает (ревизия, буфер) из одного снимка базы."""
+    # Явная транзакция чтения, чтобы ревизия и строки экспорта были согласованы
+    conn.execute('BEGIN')
+    revision = get_revision(conn, user_id)
+    return revision, render_export(conn, user_id, export_format)
+
+
+async def fetch_revision(user_id) -> int:
+    return await database.run(get_revision, user_id)
+
+
+async def export_transactions(user_id, export_format):
+    """Формирует экспорт транзакций пользователя в пуле потоков базы данных.
+
+    Возвращает (ревизия данных, буфер).
+    """
+    return await database.run(render_export_at_revision, user_id, export_format)
@@ -0,0 +1,213 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import asyncio
+import sqlite3
+import datetime
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import database
+from local_parser import RELATIVE_DATES
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "10000"))
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+# Путь к файлу SQLite для сохранения кэша между перезапусками (пусто - только в памяти)
+EXTRACTION_CACHE_DB = os.getenv("EXTRACTION_CACHE_DB", "")
+# Версия формата результата в ключе: записи прежних форматов (одна транзакция,
+# смещение вместо абсолютной даты, записанной словами или днём недели) не используются
+CACHE_FORMAT = 4
+
+_MONTHS = (
+    r'январ|феврал|март|апрел|ма[йя]\b|июн|июл|август|сентябр|октябр|ноябр|декабр'
+    r'|(?:янв|фев|апр|авг|сент?|окт|ноя|дек)\b'
+    r'|січ|лют|берез|квіт|травн|червн|липн|серпн|вересн|жовтн|листопад|грудн'
+    r'|jan|feb|mar|apr|may\b|jun|jul|aug|sep|oct|nov|dec'
+)
+_EN_MONTHS = (
+    r'jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?'
+    r'|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?'
+)
+# Явная дата в тексте: "2026-05-01", "1.05", "01/05/2026", "1 мая", "May 1"
+DATE_MENTION_PATTERN = re.compile(
+    r'\d{4}-\d{1,2}-\d{1,2}|\b\d{1,2}[./]\d{1,2}(?:[./]\d{2,4})?\b'
+    rf'|\b\d{{1,2}}(?:-?го|st|nd|rd|th)?\s+(?:{_MONTHS})'
+    rf'|\b(?:{_EN_MONTHS})\.?\s+\d{{1,2}}\b'
+)
+
+# Даты, которые ИИ вычисляет от текущего дня иначе, чем RELATIVE_DATES: дни недели, "неделю назад"
+OTHER_DATE_WORDS_PATTERN = re.compile(
+    r'понедельн|вторник|сред[ауы]\b|четверг|пятниц|суббот|воскресен'
+    r'|понеділ|вівтор|середу?\b|четвер|п.ятниц|субот|неділ'
+    r'|monday|tuesday|wednesday|thursday|friday|saturday|sunday'
+    r'|назад|прошл|минул|позапрошл|ago\b|last\b|\bweek|недел|тижн'
+)
+
+
+def normalize_text(text) -> str:
+    return " ".join(text.lower().split())
+
+
+class ExtractionCache:
+    """LRU-кэш результатов извлечения транзакций с TTL и необязательным хранением в SQLite.
+
+    Даты, которых нет в тексте сообщения явно ("вчера", без даты), хранятся как смещение
+    в днях и при чтении пересчитываются относительно текущей даты.
+    """
+
+    def __init__(self, max_entries=EXTRACTION_CACHE_SIZE, ttl=EXTRACTION_CACHE_TTL, db_file=EXTRACTION_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._executor = None
+        if db_file:
+            # Запросы к файлу кэша выполняются в отдельном потоке, чтобы не блокировать event loop
+            self._conn = database.connect(db_file)
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT,
+                    expires_at REAL
+                )
+            ''')
+            self._conn.execute('DELETE FROM extraction_cache WHERE expires_at < ?', (time.time(),))
+            self._conn.commit()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction-cache")
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _db_get(self, key, now):
+        return self._conn.execute(
+            'SELECT expires_at, payload FROM extraction_cache WHERE key = ? AND expires_at >= ?', (key, now)
+        ).fetchone()
+
+    def _db_put(self, key, entry) -> None:
+        try:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO extraction_cache (key, payload, expires_at) VALUES (?, ?, ?)',
+                    (key, entry[1], entry[0])
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache database error: {e}")
+
+    @staticmethod
+    def make_key(text, categories, default_currency) -> str:
+        raw = json.dumps(
+            [CACHE_FORMAT, normalize_text(text), sorted(categories), default_currency], ensure_ascii=False
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, text, categories, default_currency, current_date):
+        """Возвращает закэшированный результат или None."""
+        key = self.make_key(text, categories, default_currency)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < now:
+            self._remove(key)
+            entry = None
+        if entry is None and self._conn is not None:
+            try:
+                row = await self._run_db(self._db_get, key, now)
+            except sqlite3.Error as e:
+                logger.error(f"Extraction cache database error: {e}")
+                row = None
+            if row:
+                entry = row
+                self._store(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        result = json.loads(entry[1])
+        for transaction in result.get("transactions", []):
+            if "date_offset" in transaction:
+                offset = transaction.pop("date_offset")
+                transaction["date"] = (current_date + datetime.timedelta(days=offset)).isoformat()
+        return result
+
+    async def put(self, text, categories, default_currency, current_date, result) -> None:
+        key = self.make_key(text, categories, default_currency)
+        payload = dict(result)
+        if "transactions" in payload:
+            transactions = [
+                self._relative_date(transaction, text, current_date) for transaction in payload["transactions"]
+            ]
+            if None in transactions:
+                # Дату нельзя пересчитать для другого дня ("в пятницу") - такой результат не кэшируется
+                return
+            payload["transactions"] = transactions
+        entry = (time.time() + self.ttl, json.dumps(payload, ensure_ascii=False))
+        self._store(key, entry)
+        if self._conn is not None:
+            await self._run_db(self._db_put, key, entry)
+
+    @staticmethod
+    def _relative_date(transaction, text, current_date):
+        """Готовит транзакцию к кэшированию так, чтобы её дата была верна и в другой день.
+
+        Дата из слова RELATIVE_DATES ("вчера") или при отсутствии даты в сообщении хранится
+        смещением от current_date, дата, записанная явно (цифрами или словами), - как есть.
+        Для остальных случаев (дни недели, "неделю назад") возвращает None: результат зависит
+        от дня, когда пришло сообщение, и его нельзя переиспользовать.
+        """
+        transaction = dict(transaction)
+        date = transaction.get("date")
+        if not date:
+            return transaction
+        lowered = text.lower()
+        offset = (datetime.date.fromisoformat(date) - current_date).days
+        relative_offsets = {RELATIVE_DATES[word] for word in re.findall(r'\w+', lowered) if word in RELATIVE_DATES}
+        if offset in relative_offsets:
+            transaction["date_offset"] = offset
+            del transaction["date"]
+            return transaction
+        if OTHER_DATE_WORDS_PATTERN.search(lowered):
+            return None
+        if DATE_MENTION_PATTERN.search(lowered):
+            return transaction
+        if offset == 0:
+            # В сообщении нет даты - ИИ поставил текущий день
+            transaction["date_offset"] = 0
+            del transaction["date"]
+            return transaction
+        return None
+
+    def _store(self, key, entry) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._memory_bytes += sys.getsizeof(key) + sys.getsizeof(entry[1])
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key) -> None:
+        _, payload = self._entries.pop(key)
+        self._memory_bytes -= sys.getsizeof(key) + sys.getsizeof(payload)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters, hit ratio, entry count and approximate memory use."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "memory_bytes": self._memory_bytes,
+        }
+
+
+extraction_cache = ExtractionCache()
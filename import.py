@@ -1,37 +1,71 @@
-import sqlite3
-import csv
+"""Импорт банковской выписки (CSV/XLSX) в transactions из командной строки.
 
-def export_to_csv(db_file, csv_file):
-    """Экспортирует данные из базы данных в CSV файл."""
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
+Пример:
+    python import.py statement.csv --user-id 123456789
+    python import.py statement.xlsx --user-id 123456789 --map date="Дата операції" --map amount="Сума"
+"""
+import sys
+import json
+import argparse
+import logging
+import database
+from migrations import apply_migrations
+from statement_import import import_statement, detect_format, format_import_result, StatementFormatError
 
-    # Извлечение данных из таблицы user_data
-    cursor.execute('SELECT * FROM user_data')
-    user_data_rows = cursor.fetchall()
 
-    # Извлечение данных из таблицы transactions
-    cursor.execute('SELECT * FROM transactions')
-    transaction_rows = cursor.fetchall()
+def load_profile(conn, user_id):
+    """Категории и валюта пользователя для автоматического назначения категорий."""
+    row = conn.execute('SELECT categories, default_currency FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
+    if row is None:
+        return [], None
+    categories, default_currency = row
+    return (json.loads(categories) if categories else []), default_currency
 
-    conn.close()
 
-    # Запись данных в CSV файл
-    with open(csv_file, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
+def parse_mapping(pairs) -> dict:
+    mapping = {}
+    for pair in pairs:
+        field, _, column = pair.partition('=')
+        if not column:
+            raise argparse.ArgumentTypeError(f"Ожидается поле=колонка, получено: {pair}")
+        mapping[field.strip()] = column.strip()
+    return mapping
 
-        # Запись заголовков для user_data
-        writer.writerow(['user_id', 'final_balance', 'changes', 'dates', 'categories'])
-        writer.writerows(user_data_rows)
 
-        # Пустая строка между таблицами
-        writer.writerow([])
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="файл выписки .csv или .xlsx")
+    parser.add_argument("--user-id", required=True, help="Telegram user_id владельца транзакций")
+    parser.add_argument("--currency", help="валюта строк без колонки валюты (по умолчанию из профиля)")
+    parser.add_argument("--db", help="файл базы данных (по умолчанию DB_PATH)")
+    parser.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                        help="явное сопоставление колонки: date, amount, debit, credit, currency, description, category")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 
-        # Запись заголовков для transactions
-        writer.writerow(['id', 'user_id', 'amount', 'date', 'category'])
-        writer.writerows(transaction_rows)
+    try:
+        file_format = detect_format(args.file)
+        mapping = parse_mapping(args.map)
+    except (StatementFormatError, argparse.ArgumentTypeError) as e:
+        print(e, file=sys.stderr)
+        return 2
 
-    print(f"Данные успешно экспортированы в {csv_file}")
+    conn = database.connect(args.db)
+    try:
+        apply_migrations(conn)
+        categories, default_currency = load_profile(conn, args.user_id)
+        with conn:
+            stats = import_statement(
+                conn, args.user_id, args.file, file_format, categories, args.currency or default_currency, mapping
+            )
+    except StatementFormatError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    print(format_import_result(stats))
+    return 0
 
-# Пример использования
-export_to_csv('user_info.db', 'exported_data.csv')
+
+if __name__ == "__main__":
+    sys.exit(main())
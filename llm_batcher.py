@@ -0,0 +1,113 @@
+import os
+import asyncio
+import logging
+from transaction_extraction import extract_transaction, extract_transactions_batch
+
+logger = logging.getLogger(__name__)
+
+# Окно накопления запросов (в секундах) и максимальный размер пакета
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0.05"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "10"))
+
+
+class ExtractionBatcher:
+    """Собирает запросы на извлечение от разных пользователей в один запрос к модели.
+
+    Первый запрос в пакете запускает таймер на window секунд; пакет отправляется по
+    истечении таймера или при достижении max_size. Результаты раздаются ожидающим
+    обработчикам через futures. Элементы, которые модель не вернула, повторяются
+    отдельными запросами.
+    """
+
+    def __init__(self, window=LLM_BATCH_WINDOW, max_size=LLM_BATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+        self.requests_sent = 0
+        self.items_processed = 0
+
+    async def submit(self, user_message, categories, default_currency, current_date) -> dict:
+        if self.max_size <= 1:
+            self.requests_sent += 1
+            self.items_processed += 1
+            return await extract_transaction(user_message, categories, default_currency, current_date)
+
+        future = asyncio.get_running_loop().create_future()
+        # Пакеты группируются по дате, так как она входит в системный промпт
+        batch = self._pending.setdefault(current_date, [])
+        batch.append(((user_message, categories, default_currency), future))
+
+        if len(batch) >= self.max_size:
+            self._flush_now(current_date)
+        elif current_date not in self._timers:
+            self._timers[current_date] = asyncio.get_running_loop().call_later(
+                self.window, self._flush_now, current_date
+            )
+        return await future
+
+    def _flush_now(self, current_date) -> None:
+        timer = self._timers.pop(current_date, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(current_date, [])
+        if batch:
+            # Ссылка на задачу хранится до её завершения, иначе сборщик мусора может её удалить
+            task = asyncio.get_running_loop().create_task(self._process(batch, current_date))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch, current_date) -> None:
+        try:
+            await self._process_batch(batch, current_date)
+        finally:
+            # Ни один обработчик не должен ждать вечно, даже если пакет упал или был отменён
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Extraction batch finished without a result"))
+
+    async def _process_batch(self, batch, current_date) -> None:
+        items = [item for item, _ in batch]
+        self.items_processed += len(items)
+        if len(items) == 1:
+            results = [None]
+        else:
+            self.requests_sent += 1
+            try:
+                results = await extract_transactions_batch(items, current_date)
+            except Exception as e:
+                logger.error(f"Batch extraction failed, falling back to single requests: {e}")
+                results = [None] * len(items)
+
+        retries = []
+        for (item, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is not None:
+                future.set_result(result)
+            else:
+                retries.append(self._process_single(item, future, current_date))
+        await asyncio.gather(*retries)
+
+    async def _process_single(self, item, future, current_date) -> None:
+        self.requests_sent += 1
+        try:
+            result = await extract_transaction(*item, current_date)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        """Returns the number of LLM requests sent and items processed."""
+        return {
+            "requests_sent": self.requests_sent,
+            "items_processed": self.items_processed,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+        }
+
+
+extraction_batcher = ExtractionBatcher()
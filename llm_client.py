@@ -0,0 +1,52 @@
+import os
+import logging
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Настройки клиента OpenAI (можно переопределить через переменные окружения)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+
+_client = None
+
+
+def get_client() -> openai.AsyncOpenAI:
+    """Возвращает общий асинхронный клиент OpenAI, создавая его при первом вызове."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            ),
+        )
+        _client = openai.AsyncOpenAI(
+            api_key=os.getenv("API_KEY"),
+            max_retries=LLM_MAX_RETRIES,
+            timeout=LLM_TIMEOUT,
+            http_client=http_client,
+        )
+    return _client
+
+
+async def complete(messages, **kwargs) -> str:
+    """Sends a chat completion request through the shared client and returns the reply text."""
+    kwargs.setdefault("model", LLM_MODEL)
+    response = await get_client().chat.completions.create(messages=messages, **kwargs)
+    return response.choices[0].message.content.strip()
+
+
+async def close_client(*_args) -> None:
+    """Закрывает общий клиент и его пул соединений (используется как post_shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("LLM client closed")
@@ -0,0 +1,151 @@
+import re
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Коды и символы валют, которые распознаются без обращения к ИИ
+CURRENCY_ALIASES = {
+    "$": "USD", "usd": "USD", "долл": "USD", "доллар": "USD", "доллара": "USD", "долларов": "USD", "долар": "USD", "доларів": "USD",
+    "€": "EUR", "eur": "EUR", "евро": "EUR", "євро": "EUR",
+    "₴": "UAH", "uah": "UAH", "грн": "UAH", "гривна": "UAH", "гривен": "UAH", "гривень": "UAH", "гривні": "UAH",
+    "₽": "RUB", "rub": "RUB", "руб": "RUB", "рубль": "RUB", "рублей": "RUB",
+    "£": "GBP", "gbp": "GBP",
+    "zł": "PLN", "pln": "PLN", "злотых": "PLN",
+    "₸": "KZT", "kzt": "KZT", "тенге": "KZT",
+}
+
+# Относительные даты: слово -> смещение в днях от текущей даты
+RELATIVE_DATES = {
+    "сегодня": 0, "сьогодні": 0, "today": 0,
+    "вчера": -1, "вчора": -1, "yesterday": -1,
+    "позавчера": -2, "позавчора": -2,
+}
+
+AMOUNT_PATTERN = re.compile(r'^([+-]?)(\d+(?:[.,]\d+)?)$')
+# Разделитель и ровно три цифры после него: тысячи или дробная часть - неизвестно
+THOUSANDS_AMBIGUOUS_PATTERN = re.compile(r'^\d+[.,]\d{3}$')
+ISO_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# Отделяет символ валюты, приклеенный к числу: "$50", "50₴", "50грн"
+TOKEN_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}|[+-]?\d+(?:[.,]\d+)?|[$€₴₽£₸]|[^\s\d$€₴₽£₸+,;]+|[+-]')
+
+# Разделители транзакций в одном сообщении; запятая без пробела остаётся десятичной ("12,5")
+SEPARATOR_PATTERN = re.compile(r'[;\n]|,\s')
+
+UKRAINIAN_LETTERS = set("іїєґ")
+
+# Счётчики попаданий локального парсера
+PARSER_STATS = {"hits": 0, "misses": 0}
+
+
+def detect_language(text) -> str:
+    """Грубое определение языка сообщения по алфавиту."""
+    lowered = text.lower()
+    if any(ch in UKRAINIAN_LETTERS for ch in lowered):
+        return "uk"
+    if re.search('[а-яё]', lowered):
+        return "ru"
+    return "en"
+
+
+def _tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _parse(text, categories, default_currency, current_date, expense_categories):
+    tokens = _tokenize(text)
+    amount = None
+    sign = ""
+    currency = None
+    date = None
+    words = []
+
+    for i, token in enumerate(tokens):
+        match = AMOUNT_PATTERN.match(token)
+        if ISO_DATE_PATTERN.match(token):
+            if date is not None:
+                return None
+            try:
+                date = datetime.date.fromisoformat(token)
+            except ValueError:
+                return None
+        elif match:
+            if amount is not None:
+                return None
+            # "1,000" и "1.000" могут означать и тысячу, и единицу - решает ИИ
+            if THOUSANDS_AMBIGUOUS_PATTERN.match(match.group(2)):
+                return None
+            sign, amount = match.group(1), float(match.group(2).replace(',', '.'))
+            # Знак, записанный отдельным токеном: "+ 300"
+            if not sign and i > 0 and tokens[i - 1] in ('+', '-'):
+                sign = tokens[i - 1]
+        elif token in ('+', '-'):
+            continue
+        elif token in CURRENCY_ALIASES or token.upper() in CURRENCY_ALIASES.values():
+            if currency is not None:
+                return None
+            currency = CURRENCY_ALIASES.get(token, token.upper())
+        elif token in RELATIVE_DATES:
+            if date is not None:
+                return None
+            date = current_date + datetime.timedelta(days=RELATIVE_DATES[token])
+        else:
+            words.append(token)
+
+    if amount is None or not words:
+        return None
+
+    # Остаток сообщения должен целиком совпадать с одной из категорий пользователя
+    lookup = {c.lower(): c for c in categories}
+    category = lookup.get(" ".join(words))
+    if category is None:
+        return None
+
+    # Без явного знака сумма считается расходом, только если категория известна как расходная;
+    # иначе ("зарплата 30000") знак определяет ИИ
+    if not sign and category not in expense_categories:
+        return None
+    balance_change = int(round(amount))
+    if sign != "+":
+        balance_change = -balance_change
+
+    return {
+        "balance_change": balance_change,
+        "date": (date or current_date).isoformat(),
+        "category": category,
+        "currency": currency or default_currency or "USD",
+    }
+
+
+def parse_transaction(text, categories, default_currency, current_date, expense_categories=()):
+    """Разбирает простое сообщение о транзакциях локально.
+
+    Сообщение может содержать несколько транзакций через запятую с пробелом, точку с запятой
+    или перевод строки ("кофе 50, такси 120"); разобраться должна каждая часть.
+    Возвращает результат в том же формате, что и transaction_extraction.extract_transaction,
+    или None, если сообщение нельзя разобрать уверенно и нужно обратиться к ИИ.
+    Сумма со знаком "+" - доход, со знаком "-" - расход; сумма без знака считается расходом
+    только в категориях из expense_categories, иначе сообщение уходит ИИ.
+    """
+    transactions = []
+    for part in SEPARATOR_PATTERN.split(text):
+        if not part.strip():
+            continue
+        transaction = _parse(part, categories, default_currency, current_date, expense_categories)
+        if transaction is None:
+            transactions = []
+            break
+        transactions.append(transaction)
+
+    if not transactions:
+        PARSER_STATS["misses"] += 1
+        return None
+    PARSER_STATS["hits"] += 1
+    return {"is_financial": True, "language": detect_language(text), "transactions": transactions}
+
+
+def get_parser_stats() -> dict:
+    """Returns hit/miss counters and the share of messages handled locally."""
+    total = PARSER_STATS["hits"] + PARSER_STATS["misses"]
+    hit_ratio = PARSER_STATS["hits"] / total if total else 0.0
+    return {**PARSER_STATS, "total": total, "hit_ratio": hit_ratio}
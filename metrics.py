@@ -0,0 +1,68 @@
+import os
+import json
+import asyncio
+import logging
+from update_scheduler import update_processor
+from local_parser import get_parser_stats
+from extraction_cache import extraction_cache
+from llm_batcher import extraction_batcher
+from user_profiles import profiles
+from transaction_buffer import transaction_buffer
+from export_cache import export_cache
+from persistence import persistence
+from background_worker import background_worker
+
+logger = logging.getLogger(__name__)
+
+# Период записи метрик в лог, в секундах (0 - не писать)
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
+
+
+def collect() -> dict:
+    """Счётчики всех компонентов бота одним словарём (для /health и периодического лога)."""
+    return {
+        "updates": update_processor.stats(),
+        "local_parser": get_parser_stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "llm_batcher": extraction_batcher.stats(),
+        "profiles": profiles.stats(),
+        "transaction_buffer": transaction_buffer.stats(),
+        "export_cache": export_cache.stats(),
+        "persistence": persistence.stats(),
+        "background_worker": background_worker.stats(),
+    }
+
+
+class MetricsLogger:
+    """Раз в interval секунд пишет collect() в лог одной строкой JSON."""
+
+    def __init__(self, interval=METRICS_LOG_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is not None or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self.log()
+
+    def log(self) -> None:
+        logger.info(f"Metrics: {json.dumps(collect(), default=str)}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.log()
+            except Exception as e:
+                logger.error(f"Could not collect metrics: {e}")
+
+
+metrics_logger = MetricsLogger()
@@ -0,0 +1,331 @@
+import logging
+import datetime
+
+logger = logging.getLogger(__name__)
+
+# Версионированные миграции схемы: (версия, описание, шаги).
+# Шаг - SQL-строка или функция, принимающая соединение.
+# Уже применённые миграции не изменять - только добавлять новые в конец списка.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id TEXT PRIMARY KEY,
+            categories TEXT,
+            default_currency TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            amount INTEGER,
+            date DATE,
+            category TEXT,
+            currency TEXT,
+            FOREIGN KEY(user_id) REFERENCES user_data(user_id)
+        )
+        ''',
+    ]),
+    (2, "indexes on transactions by user", [
+        'CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_user_category ON transactions (user_id, category)',
+    ]),
+    # Дневные итоги по (пользователь, день, категория, валюта) для /report.
+    # Поддерживаются триггерами в той же транзакции, что и изменение transactions.
+    (3, "daily totals rollup", [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id TEXT NOT NULL,
+            day DATE NOT NULL,
+            category TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            income INTEGER NOT NULL DEFAULT 0,
+            expenses INTEGER NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, category, currency)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO daily_totals (user_id, day, category, currency, income, expenses, tx_count)
+            VALUES (
+                NEW.user_id, NEW.date, IFNULL(NEW.category, ''), IFNULL(NEW.currency, ''),
+                CASE WHEN NEW.amount > 0 THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.amount > 0 THEN 0 ELSE -NEW.amount END,
+                1
+            )
+            ON CONFLICT (user_id, day, category, currency) DO UPDATE SET
+                income = income + excluded.income,
+                expenses = expenses + excluded.expenses,
+                tx_count = tx_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE daily_totals SET
+                income = income - CASE WHEN OLD.amount > 0 THEN OLD.amount ELSE 0 END,
+                expenses = expenses - CASE WHEN OLD.amount > 0 THEN 0 ELSE -OLD.amount END,
+                tx_count = tx_count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.date
+                AND category = IFNULL(OLD.category, '') AND currency = IFNULL(OLD.currency, '');
+            DELETE FROM daily_totals
+            WHERE user_id = OLD.user_id AND day = OLD.date
+                AND category = IFNULL(OLD.category, '') AND currency = IFNULL(OLD.currency, '')
+                AND tx_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+        AFTER UPDATE OF user_id, amount, date, category, currency ON transactions
+        BEGIN
+            UPDATE daily_totals SET
+                income = income - CASE WHEN OLD.amount > 0 THEN OLD.amount ELSE 0 END,
+                expenses = expenses - CASE WHEN OLD.amount > 0 THEN 0 ELSE -OLD.amount END,
+                tx_count = tx_count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.date
+                AND category = IFNULL(OLD.category, '') AND currency = IFNULL(OLD.currency, '');
+            DELETE FROM daily_totals
+            WHERE user_id = OLD.user_id AND day = OLD.date
+                AND category = IFNULL(OLD.category, '') AND currency = IFNULL(OLD.currency, '')
+                AND tx_count <= 0;
+            INSERT INTO daily_totals (user_id, day, category, currency, income, expenses, tx_count)
+            VALUES (
+                NEW.user_id, NEW.date, IFNULL(NEW.category, ''), IFNULL(NEW.currency, ''),
+                CASE WHEN NEW.amount > 0 THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.amount > 0 THEN 0 ELSE -NEW.amount END,
+                1
+            )
+            ON CONFLICT (user_id, day, category, currency) DO UPDATE SET
+                income = income + excluded.income,
+                expenses = expenses + excluded.expenses,
+                tx_count = tx_count + 1;
+        END
+        ''',
+        '''
+        INSERT OR REPLACE INTO daily_totals (user_id, day, category, currency, income, expenses, tx_count)
+        SELECT
+            user_id, date, IFNULL(category, ''), IFNULL(currency, ''),
+            SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+            SUM(CASE WHEN amount > 0 THEN 0 ELSE -amount END),
+            COUNT(*)
+        FROM transactions
+        GROUP BY user_id, date, IFNULL(category, ''), IFNULL(currency, '')
+        ''',
+    ]),
+    # Счётчик ревизий данных пользователя: увеличивается при любом изменении его транзакций
+    # (добавление, изменение, удаление, переименование категории). Используется кэшем экспорта.
+    (4, "per-user data revisions", [
+        '''
+        CREATE TABLE IF NOT EXISTS data_revisions (
+            user_id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_revision_insert AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO data_revisions (user_id, revision) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_revision_update AFTER UPDATE ON transactions
+        BEGIN
+            INSERT INTO data_revisions (user_id, revision) VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1;
+            INSERT INTO data_revisions (user_id, revision) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_revision_delete AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO data_revisions (user_id, revision) VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET revision = revision + 1;
+        END
+        ''',
+    ]),
+    (5, "broadcast jobs", [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_chat_id TEXT NOT NULL,
+            progress_message_id INTEGER,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id TEXT NOT NULL DEFAULT '',
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            finished_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    # Исходный текст сообщения и полнотекстовый индекс по нему (external content FTS5:
+    # сам текст хранится только в transactions, индекс поддерживается триггерами)
+    (6, "original message text with FTS5 index", [
+        'ALTER TABLE transactions ADD COLUMN message TEXT',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            message,
+            content = 'transactions',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions
+        WHEN NEW.message IS NOT NULL
+        BEGIN
+            INSERT INTO transactions_fts (rowid, message) VALUES (NEW.id, NEW.message);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions
+        WHEN OLD.message IS NOT NULL
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, message) VALUES ('delete', OLD.id, OLD.message);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update AFTER UPDATE OF id, message ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, message)
+            SELECT 'delete', OLD.id, OLD.message WHERE OLD.message IS NOT NULL;
+            INSERT INTO transactions_fts (rowid, message)
+            SELECT NEW.id, NEW.message WHERE NEW.message IS NOT NULL;
+        END
+        ''',
+    ]),
+    # Состояние диалогов (user_data, chat_data, bot_data) для persistence.SQLitePersistence
+    (7, "bot persistence data", [
+        '''
+        CREATE TABLE IF NOT EXISTS persistence_data (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    # Отпечаток строки импортированной выписки; частичный индекс не затрагивает транзакции из чата
+    (8, "fingerprint for imported transactions", [
+        'ALTER TABLE transactions ADD COLUMN fingerprint TEXT',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_fingerprint
+        ON transactions (fingerprint) WHERE fingerprint IS NOT NULL
+        ''',
+        # Построчная вставка в FTS из триггера во время массового импорта в несколько раз медленнее
+        # одной вставки INSERT ... SELECT, поэтому строки с отпечатком индексирует statement_import
+        'DROP TRIGGER IF EXISTS trg_transactions_fts_insert',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions
+        WHEN NEW.message IS NOT NULL AND NEW.fingerprint IS NULL
+        BEGIN
+            INSERT INTO transactions_fts (rowid, message) VALUES (NEW.id, NEW.message);
+        END
+        ''',
+    ]),
+    # user_id в индексе: запрос user_id:"<id>" AND message:(...) не собирает совпадения всех пользователей
+    (9, "user-scoped FTS5 index", [
+        'DROP TRIGGER IF EXISTS trg_transactions_fts_insert',
+        'DROP TRIGGER IF EXISTS trg_transactions_fts_delete',
+        'DROP TRIGGER IF EXISTS trg_transactions_fts_update',
+        'DROP TABLE IF EXISTS transactions_fts',
+        '''
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            user_id,
+            message,
+            content = 'transactions',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER trg_transactions_fts_insert AFTER INSERT ON transactions
+        WHEN NEW.message IS NOT NULL AND NEW.fingerprint IS NULL
+        BEGIN
+            INSERT INTO transactions_fts (rowid, user_id, message) VALUES (NEW.id, NEW.user_id, NEW.message);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_transactions_fts_delete AFTER DELETE ON transactions
+        WHEN OLD.message IS NOT NULL
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, user_id, message)
+            VALUES ('delete', OLD.id, OLD.user_id, OLD.message);
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_transactions_fts_update AFTER UPDATE OF id, user_id, message ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, user_id, message)
+            SELECT 'delete', OLD.id, OLD.user_id, OLD.message WHERE OLD.message IS NOT NULL;
+            INSERT INTO transactions_fts (rowid, user_id, message)
+            SELECT NEW.id, NEW.user_id, NEW.message WHERE NEW.message IS NOT NULL;
+        END
+        ''',
+        "INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')",
+    ]),
+]
+
+
+def get_schema_version(conn) -> int:
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn) -> int:
+    """Переводит базу в режим WAL и применяет недостающие миграции.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью в schema_version,
+    поэтому прерванный запуск не оставляет схему в промежуточном состоянии.
+    Возвращает итоговую версию схемы.
+    """
+    # journal_mode сохраняется в файле базы, его нельзя менять внутри транзакции
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    conn.commit()
+
+    current_version = get_schema_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        try:
+            conn.execute('BEGIN')
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            logger.error(f"Migration {version} failed, schema left at version {current_version}")
+            raise
+        current_version = version
+    return current_version
@@ -0,0 +1,227 @@
+import os
+import zlib
+import pickle
+import asyncio
+import logging
+import sqlite3
+from telegram.ext import BasePersistence, PersistenceInput
+import database
+
+logger = logging.getLogger(__name__)
+
+# Как часто Application передаёт изменённые user_data/chat_data на запись, секунды
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "10"))
+# Данные больше этого размера (байт) сжимаются zlib
+PERSISTENCE_COMPRESS_MIN = int(os.getenv("PERSISTENCE_COMPRESS_MIN", "256"))
+
+# Первый байт записи - формат: обычный pickle или pickle, сжатый zlib
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+
+USER = 'user'
+CHAT = 'chat'
+BOT = 'bot'
+CONVERSATION = 'conversation'
+
+
+def encode(data) -> bytes:
+    payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(payload) >= PERSISTENCE_COMPRESS_MIN:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            return _ZLIB + compressed
+    return _RAW + payload
+
+
+def decode(blob):
+    blob = bytes(blob)
+    payload = blob[1:]
+    if blob[:1] == _ZLIB:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранение user_data, chat_data, bot_data и состояний диалогов в таблице persistence_data.
+
+    user_data и chat_data загружаются лениво: при старте Application получает пустые словари,
+    а данные конкретного пользователя читаются из базы в refresh_user_data перед обработкой
+    его первого обновления. Поэтому время запуска не зависит от числа пользователей.
+
+    Запись отложенная: Application раз в update_interval передаёт изменённые записи, они
+    копятся и сохраняются одним executemany. Неизменившиеся данные не перезаписываются.
+    """
+
+    def __init__(self, update_interval=PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self._loaded = {USER: set(), CHAT: set()}
+        self._hashes = {}  # (kind, key) -> crc32 последней сохранённой записи
+        self._pending = {}  # (kind, key) -> blob или None для удаления
+        self._flush_task = None
+        self._conversations = {}
+        self.loads = 0
+        self.writes = 0
+        self.writes_skipped = 0
+        self.flushes = 0
+
+    # Загрузка
+
+    async def _load(self, kind, key):
+        row = await database.fetchone(
+            'SELECT data FROM persistence_data WHERE kind = ? AND key = ?', (kind, str(key))
+        )
+        self.loads += 1
+        if row is None:
+            return None
+        self._hashes[(kind, str(key))] = zlib.crc32(row[0])
+        try:
+            return decode(row[0])
+        except Exception as e:
+            logger.error(f"Could not decode persisted {kind} data for {key}: {e}")
+            return None
+
+    async def _refresh(self, kind, key, data) -> None:
+        if key in self._loaded[kind]:
+            return
+        if (kind, str(key)) in self._pending:
+            # Данные ещё не записаны в базу - в памяти актуальнее
+            self._loaded[kind].add(key)
+            return
+        try:
+            stored = await self._load(kind, key)
+        except sqlite3.Error as e:
+            # Не помечаем как загруженные, чтобы не перезаписать сохранённые данные пустыми
+            logger.error(f"Error loading persisted {kind} data for {key}: {e}")
+            return
+        if stored:
+            # Сохранённые значения не затирают то, что уже успел записать текущий обработчик
+            for name, value in stored.items():
+                data.setdefault(name, value)
+        self._loaded[kind].add(key)
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return await self._load(BOT, '') or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name) -> dict:
+        if name not in self._conversations:
+            self._conversations[name] = await self._load(CONVERSATION, name) or {}
+        return dict(self._conversations[name])
+
+    async def refresh_user_data(self, user_id, user_data) -> None:
+        await self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data) -> None:
+        await self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    # Запись
+
+    async def _store(self, kind, key, data) -> None:
+        key = str(key)
+        if data is None:
+            self._pending[(kind, key)] = None
+            self._hashes.pop((kind, key), None)
+        else:
+            blob = encode(data)
+            digest = zlib.crc32(blob)
+            if self._hashes.get((kind, key)) == digest:
+                self.writes_skipped += 1
+                return
+            self._pending[(kind, key)] = blob
+            self._hashes[(kind, key)] = digest
+        # Application вызывает update_* для всех изменённых записей через gather, поэтому
+        # задача записи стартует после того, как все они положат данные в _pending
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._write_pending())
+        await asyncio.shield(self._flush_task)
+
+    async def _write_pending(self) -> None:
+        await asyncio.sleep(0)
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        if not pending:
+            return
+        upserts = [(kind, key, blob) for (kind, key), blob in pending.items() if blob is not None]
+        deletes = [(kind, key) for (kind, key), blob in pending.items() if blob is None]
+
+        def write(conn):
+            conn.executemany(
+                'INSERT INTO persistence_data (kind, key, data) VALUES (?, ?, ?) '
+                'ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data',
+                upserts
+            )
+            conn.executemany('DELETE FROM persistence_data WHERE kind = ? AND key = ?', deletes)
+
+        try:
+            await database.run(write)
+            self.writes += len(pending)
+            self.flushes += 1
+        except sqlite3.Error as e:
+            logger.error(f"Error writing persisted data ({len(pending)} entries): {e}")
+            for kind_key in pending:
+                self._hashes.pop(kind_key, None)
+
+    async def update_user_data(self, user_id, data) -> None:
+        # Данные незагруженного пользователя неполные - их запись затёрла бы сохранённые
+        if user_id in self._loaded[USER]:
+            await self._store(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id, data) -> None:
+        if chat_id in self._loaded[CHAT]:
+            await self._store(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data) -> None:
+        await self._store(BOT, '', data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name, key, new_state) -> None:
+        conversation = self._conversations.setdefault(name, {})
+        if new_state is None:
+            conversation.pop(key, None)
+        else:
+            conversation[key] = new_state
+        await self._store(CONVERSATION, name, conversation)
+
+    async def drop_user_data(self, user_id) -> None:
+        self._loaded[USER].discard(user_id)
+        await self._store(USER, user_id, None)
+
+    async def drop_chat_data(self, chat_id) -> None:
+        self._loaded[CHAT].discard(chat_id)
+        await self._store(CHAT, chat_id, None)
+
+    async def flush(self) -> None:
+        """Вызывается Application при остановке после последнего update_*."""
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._pending:
+            await self._write_pending()
+
+    def stats(self) -> dict:
+        return {
+            "loaded_users": len(self._loaded[USER]),
+            "loads": self.loads,
+            "writes": self.writes,
+            "writes_skipped": self.writes_skipped,
+            "flushes": self.flushes,
+            "pending": len(self._pending),
+        }
+
+
+persistence = SQLitePersistence()
@@ -0,0 +1,306 @@
+import os
+import re
+import asyncio
+import csv
+import codecs
+import json
+import hashlib
+import logging
+import datetime
+from openpyxl import load_workbook
+from local_parser import CURRENCY_ALIASES
+from transaction_extraction import UNCATEGORIZED
+from user_profiles import get_user_data
+import database
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк выписки вставлять одним executemany
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+# Явное сопоставление колонок, JSON вида {"date": "Дата операції", "amount": "Сума"};
+# дополняет автоматическое определение по COLUMN_ALIASES
+IMPORT_COLUMNS = json.loads(os.getenv("IMPORT_COLUMNS", "{}"))
+
+# Поле -> возможные заголовки колонки (в нижнем регистре)
+COLUMN_ALIASES = {
+    "date": ["date", "transaction date", "booking date", "дата", "дата операции", "дата операції", "дата і час операції"],
+    "amount": ["amount", "sum", "сумма", "сума", "сумма операции", "сума в валюті картки", "сума операції"],
+    "debit": ["debit", "дебет", "списание", "списання", "расход", "витрата"],
+    "credit": ["credit", "кредит", "зачисление", "зарахування", "приход", "надходження"],
+    "currency": ["currency", "валюта", "валюта картки", "валюта операции"],
+    "description": ["description", "details", "memo", "описание", "опис", "опис операції", "деталі операції", "назначение платежа", "призначення платежу"],
+    "category": ["category", "категория", "категорія"],
+}
+
+CSV_DELIMITERS = (',', ';', '\t', '|')
+
+# Дата в начале ячейки, время после неё отбрасывается. Регулярные выражения вместо
+# strptime: на сотнях тысяч строк strptime с перебором форматов занимает большую часть импорта
+ISO_DATE_PATTERN = re.compile(r'^\s*(\d{4})-(\d{1,2})-(\d{1,2})')
+DAY_FIRST_DATE_PATTERN = re.compile(r'^\s*(\d{1,2})[./](\d{1,2})[./](\d{4}|\d{2})(?!\d)')
+
+INSERT_IMPORTED = '''
+    INSERT OR IGNORE INTO transactions (user_id, amount, date, category, currency, message, fingerprint)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class StatementFormatError(ValueError):
+    """Файл не похож на выписку: не найдены нужные колонки или неизвестный формат."""
+
+
+def detect_format(filename) -> str:
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in ('csv', 'xlsx'):
+        raise StatementFormatError(f"Неподдерживаемый формат файла: {filename}. Поддерживаются .csv и .xlsx")
+    return extension
+
+
+def iter_csv_rows(path):
+    """Построчно читает CSV, определяя кодировку (utf-8 или cp1251) и разделитель."""
+    with open(path, 'rb') as raw:
+        head = raw.read(64 * 1024)
+    try:
+        # Инкрементальный декодер не считает ошибкой символ, обрезанный на границе прочитанного блока
+        codecs.getincrementaldecoder('utf-8-sig')().decode(head)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+    # Разделитель - самый частый из возможных в первых строках (csv.Sniffer путается
+    # на шапке выписки без разделителей и на десятичных запятых)
+    lines = head.decode(encoding, errors='ignore').splitlines()[:20]
+    delimiter = max(CSV_DELIMITERS, key=lambda d: sum(line.count(d) for line in lines))
+    with open(path, newline='', encoding=encoding, errors='replace') as file:
+        yield from csv.reader(file, delimiter=delimiter)
+
+
+def iter_xlsx_rows(path):
+    """Построчно читает первый лист XLSX в режиме read-only, не загружая книгу целиком."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+ROW_READERS = {
+    'csv': iter_csv_rows,
+    'xlsx': iter_xlsx_rows,
+}
+
+
+def resolve_columns(header, mapping=None) -> dict:
+    """Возвращает поле -> индекс колонки по строке заголовков."""
+    names = [str(cell).strip().lower() if cell is not None else '' for cell in header]
+    mapping = {**IMPORT_COLUMNS, **(mapping or {})}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        explicit = mapping.get(field)
+        candidates = [explicit.strip().lower()] if explicit else aliases
+        for candidate in candidates:
+            if candidate in names:
+                columns[field] = names.index(candidate)
+                break
+    return columns
+
+
+def find_header(rows, mapping=None, max_lines=20):
+    """Пропускает шапку выписки до строки заголовков с датой и суммой."""
+    for _ in range(max_lines):
+        header = next(rows, None)
+        if header is None:
+            break
+        columns = resolve_columns(header, mapping)
+        if 'date' in columns and ('amount' in columns or 'debit' in columns or 'credit' in columns):
+            return columns
+    raise StatementFormatError("Не найдены колонки с датой и суммой. Укажите сопоставление колонок явно.")
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    text = str(value or '')
+    match = ISO_DATE_PATTERN.match(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = DAY_FIRST_DATE_PATTERN.match(text)
+        if not match:
+            return None
+        day, month, year = match.groups()
+        if len(year) == 2:
+            year = f"20{year}"
+    try:
+        return datetime.date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_amount(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace('−', '-').replace('\xa0', '').replace(' ', '')
+    # Бухгалтерская запись отрицательной суммы: "(100.00)"
+    negative = re.search(r'\([^\d()]*[\d.,]+[^\d()]*\)', text) is not None
+    text = re.sub(r'[^\d,.\-+]', '', text)
+    # Десятичный разделитель - тот из "," и ".", что стоит последним, другой разделяет тысячи:
+    # "1,234.56" и "1.234,56"; несколько одинаковых разделителей - тоже тысячи ("1.234.567")
+    last = max(text.rfind(','), text.rfind('.'))
+    if last >= 0 and text.count(text[last]) == 1:
+        text = re.sub(r'[,.]', '', text[:last]) + '.' + text[last + 1:]
+    else:
+        text = re.sub(r'[,.]', '', text)
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -abs(amount) if negative else amount
+
+
+def normalize_currency(value, default_currency):
+    text = str(value or '').strip()
+    if not text:
+        return default_currency
+    return CURRENCY_ALIASES.get(text.lower(), text.upper() if re.match(r'^[A-Za-z]{3}$', text) else default_currency)
+
+
+class CategoryMatcher:
+    """Локальное определение категории: по колонке категории выписки или по названию в описании."""
+
+    def __init__(self, categories):
+        self.lookup = {c.lower(): c for c in categories}
+        names = sorted(self.lookup, key=len, reverse=True)
+        self.pattern = re.compile(
+            r'(?<!\w)(' + '|'.join(re.escape(name) for name in names) + r')', re.IGNORECASE
+        ) if names else None
+
+    def match(self, statement_category, description) -> str:
+        category = self.lookup.get(str(statement_category or '').strip().lower())
+        if category:
+            return category
+        if self.pattern is not None and description:
+            found = self.pattern.search(description)
+            if found:
+                return self.lookup[found.group(1).lower()]
+        return UNCATEGORIZED
+
+
+def _cell(row, columns, field):
+    index = columns.get(field)
+    if index is None or index >= len(row):
+        return None
+    return row[index]
+
+
+def iter_transactions(rows, columns, user_id, categories, default_currency, stats):
+    """Преобразует строки выписки в кортежи для INSERT_IMPORTED.
+
+    Отпечаток строки - хэш пользователя, даты, суммы, валюты, описания и номера повтора такой же
+    строки в файле: повторный импорт той же выписки ничего не добавляет, а две одинаковые покупки
+    за день остаются двумя транзакциями.
+    """
+    matcher = CategoryMatcher(categories)
+    occurrences = {}
+    for row in rows:
+        if not row or all(cell in (None, '') for cell in row):
+            continue
+        stats["rows"] += 1
+        date = parse_date(_cell(row, columns, 'date'))
+        amount = parse_amount(_cell(row, columns, 'amount'))
+        if amount is None and ('debit' in columns or 'credit' in columns):
+            debit = parse_amount(_cell(row, columns, 'debit')) or 0.0
+            credit = parse_amount(_cell(row, columns, 'credit')) or 0.0
+            amount = credit - abs(debit) if (debit or credit) else None
+        if date is None or amount is None:
+            stats["skipped"] += 1
+            continue
+
+        description = str(_cell(row, columns, 'description') or '').strip() or None
+        currency = normalize_currency(_cell(row, columns, 'currency'), default_currency)
+        category = matcher.match(_cell(row, columns, 'category'), description)
+        amount = int(round(amount))
+
+        key = (date, amount, currency, (description or '').lower())
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        fingerprint = hashlib.sha1(
+            '\x1f'.join([str(user_id), *map(str, key), str(occurrence)]).encode('utf-8')
+        ).hexdigest()
+        yield (str(user_id), amount, date, category, currency, description, fingerprint)
+
+
+def import_statement(conn, user_id, path, file_format, categories, default_currency, mapping=None,
+                     chunk_size=IMPORT_CHUNK_SIZE) -> dict:
+    """Импортирует выписку, вставляя строки порциями по chunk_size.
+
+    Файл читается потоково, в памяти одновременно только одна порция. Порция разбирается
+    до начала транзакции, а каждая вставка фиксируется отдельно, поэтому блокировка записи
+    не держится, пока читается файл, и обработчики бота могут сохранять расходы во время импорта.
+    При ошибке уже зафиксированные порции остаются; повторный импорт того же файла
+    пропустит их по отпечатку и добавит только остальное.
+    Возвращает счётчики: rows, inserted, duplicates, skipped.
+    """
+    stats = {"rows": 0, "inserted": 0, "duplicates": 0, "skipped": 0}
+    rows = iter(ROW_READERS[file_format](path))
+    columns = find_header(rows, mapping)
+    transactions = iter_transactions(rows, columns, user_id, categories, default_currency, stats)
+
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), transactions)]
+        if not chunk:
+            break
+        # Блокировка записи берётся сразу, чтобы между MAX(id) и вставками не вклинились другие записи
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            (last_id,) = conn.execute('SELECT IFNULL(MAX(id), 0) FROM transactions').fetchone()
+            inserted = conn.executemany(INSERT_IMPORTED, chunk).rowcount
+            # Строки с отпечатком триггер не индексирует - добавляем их в FTS одним запросом
+            conn.execute('''
+                INSERT INTO transactions_fts (rowid, user_id, message)
+                SELECT id, user_id, message FROM transactions
+                WHERE id > ? AND user_id = ? AND fingerprint IS NOT NULL AND message IS NOT NULL
+            ''', (last_id, str(user_id)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        stats["inserted"] += inserted
+        stats["duplicates"] += len(chunk) - inserted
+
+    logger.info(f"Statement import for {user_id}: {stats}")
+    return stats
+
+
+def format_import_result(stats) -> str:
+    return (
+        f"Импорт завершён.\n"
+        f"Строк в файле: {stats['rows']}\n"
+        f"Добавлено: {stats['inserted']}\n"
+        f"Пропущено дубликатов: {stats['duplicates']}\n"
+        f"Не распознано: {stats['skipped']}"
+    )
+
+
+def _import_with_own_connection(*args) -> dict:
+    conn = database.connect()
+    try:
+        return import_statement(conn, *args)
+    finally:
+        conn.close()
+
+
+async def import_file(user_id, path, file_format, mapping=None) -> dict:
+    """Импорт выписки для пользователя бота: категории и валюта берутся из его профиля.
+
+    Импорт большого файла занимает секунды, поэтому он идёт в отдельном потоке со своим
+    соединением, а не в общем пуле database, которым пользуются обработчики бота.
+    """
+    user_data = await get_user_data(user_id)
+    return await asyncio.to_thread(
+        _import_with_own_connection, user_id, path, file_format,
+        user_data["categories"], user_data["default_currency"], mapping
+    )
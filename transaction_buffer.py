@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import database
+
+logger = logging.getLogger(__name__)
+
+# Пакет записывается по достижении размера или по истечении окна (в секундах)
+TX_BUFFER_MAX_SIZE = int(os.getenv("TX_BUFFER_MAX_SIZE", "200"))
+TX_BUFFER_WINDOW = float(os.getenv("TX_BUFFER_WINDOW", "0.05"))
+# 1 - обработчик ждёт фиксации своей транзакции в базе, прежде чем ответить пользователю
+TX_DURABLE_BEFORE_REPLY = os.getenv("TX_DURABLE_BEFORE_REPLY", "0") == "1"
+
+INSERT_TRANSACTION = '''
+    INSERT INTO transactions (user_id, amount, date, category, currency, message)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Повтор пакета, если база занята (database is locked): задержка растёт вдвое до TX_RETRY_MAX_DELAY
+TX_RETRY_INITIAL_DELAY = float(os.getenv("TX_RETRY_INITIAL_DELAY", "0.1"))
+TX_RETRY_MAX_DELAY = float(os.getenv("TX_RETRY_MAX_DELAY", "5"))
+
+# Границы гистограммы размеров пакетов
+BATCH_SIZE_BUCKETS = (1, 5, 20, 100)
+
+
+def is_busy_error(error) -> bool:
+    """Временная ошибка блокировки SQLite, после которой запись стоит повторить."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class TransactionBuffer:
+    """Буфер вставок в transactions с групповой фиксацией.
+
+    Строки от разных обработчиков копятся и записываются одним executemany в одной транзакции
+    базы (один fsync на пакет). Без режима durable add() возвращается сразу, и строка попадает
+    в базу не позже чем через window секунд; с ним - после фиксации пакета.
+    Если база занята, пакет повторяется с нарастающей задержкой, пока не запишется.
+    При другой ошибке группы add_many записываются по отдельности: строки одного сообщения
+    остаются в одной транзакции, а ошибка в одной группе не теряет остальные.
+    """
+
+    def __init__(self, max_size=TX_BUFFER_MAX_SIZE, window=TX_BUFFER_WINDOW, durable=TX_DURABLE_BEFORE_REPLY):
+        self.max_size = max_size
+        self.window = window
+        self.durable = durable
+        self._groups = []
+        self._pending = 0
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.retries = 0
+        self.max_batch = 0
+        self.batch_sizes = dict.fromkeys([f"<={b}" for b in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"], 0)
+        self.total_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    async def add(self, row) -> None:
+        """row - (user_id, amount, date, category, currency, message)."""
+        await self.add_many([row])
+
+    async def add_many(self, rows) -> None:
+        """Добавляет строки так, что все они попадут в один пакет и одну транзакцию базы."""
+        if not rows:
+            return
+        future = asyncio.get_running_loop().create_future() if self.durable else None
+        self._groups.append((list(rows), future))
+        self._pending += len(rows)
+        if self._pending >= self.max_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        if future is not None:
+            await future
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._groups:
+            return
+        groups = self._groups
+        self._groups, self._pending = [], 0
+        task = asyncio.get_running_loop().create_task(self._write(groups))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _executemany(self, rows) -> None:
+        """executemany с повтором, пока база занята другой записью."""
+        delay = TX_RETRY_INITIAL_DELAY
+        while True:
+            try:
+                await database.executemany(INSERT_TRANSACTION, rows)
+                return
+            except sqlite3.Error as e:
+                if not is_busy_error(e):
+                    raise
+                self.retries += 1
+                logger.warning(f"Database busy while saving {len(rows)} transactions, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, TX_RETRY_MAX_DELAY)
+
+    async def _write(self, groups) -> None:
+        started = time.monotonic()
+        size = sum(len(rows) for rows, _ in groups)
+        try:
+            await self._executemany([row for rows, _ in groups for row in rows])
+            results = [None] * len(groups)
+        except sqlite3.Error as e:
+            logger.error(f"Batch insert of {size} transactions failed, retrying message by message: {e}")
+            results = await asyncio.gather(
+                *(self._executemany(rows) for rows, _ in groups), return_exceptions=True
+            )
+        self._record(size, time.monotonic() - started)
+
+        for (rows, future), result in zip(groups, results):
+            error = result if isinstance(result, Exception) else None
+            if error is not None:
+                self.rows_failed += len(rows)
+                logger.error(f"Could not save transactions {rows}: {error}")
+            else:
+                self.rows_written += len(rows)
+            if future is not None and not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    def _record(self, size, elapsed) -> None:
+        self.batches += 1
+        self.max_batch = max(self.max_batch, size)
+        bucket = next((f"<={b}" for b in BATCH_SIZE_BUCKETS if size <= b), f">{BATCH_SIZE_BUCKETS[-1]}")
+        self.batch_sizes[bucket] += 1
+        self.total_flush_time += elapsed
+        self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    async def flush(self) -> None:
+        """Записывает всё накопленное и дожидается завершения начатых записей."""
+        self._flush_now()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    async def close(self, *_args) -> None:
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Returns batch size and flush latency counters."""
+        return {
+            "pending": self._pending,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "retries": self.retries,
+            "avg_batch": (self.rows_written + self.rows_failed) / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "batch_sizes": dict(self.batch_sizes),
+            "avg_flush_time": self.total_flush_time / self.batches if self.batches else 0.0,
+            "max_flush_time": self.max_flush_time,
+        }
+
+
+transaction_buffer = TransactionBuffer()
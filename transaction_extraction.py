@@ -0,0 +1,187 @@
+import os
+import json
+import datetime
+import logging
+from llm_client import complete
+
+logger = logging.getLogger(__name__)
+
+UNCATEGORIZED = "Uncategorized"
+
+# Шаблоны подтверждения для поддерживаемых языков ответа
+CONFIRMATION_TEMPLATES = {
+    "ru": "- Изменение: {balance_change}.\n\n- Дата: {date}.\n\n- Категория: {category}.\n\n- Валюта: {currency}.",
+    "uk": "- Зміна: {balance_change}.\n\n- Дата: {date}.\n\n- Категорія: {category}.\n\n- Валюта: {currency}.",
+    "en": "- Last change: {balance_change}.\n\n- Date: {date}.\n\n- Category: {category}.\n\n- Currency: {currency}.",
+}
+DEFAULT_LANGUAGE = "ru"
+
+# Подтверждение для сообщения с несколькими транзакциями: заголовок, строки и итог по валютам
+MULTI_CONFIRMATION_HEADERS = {
+    "ru": "Сохранено транзакций: {count}.",
+    "uk": "Збережено транзакцій: {count}.",
+    "en": "Saved {count} transactions.",
+}
+MULTI_CONFIRMATION_TOTALS = {
+    "ru": "Итого",
+    "uk": "Разом",
+    "en": "Total",
+}
+
+# Сколько транзакций принимать из одного сообщения
+MAX_TRANSACTIONS_PER_MESSAGE = int(os.getenv("MAX_TRANSACTIONS_PER_MESSAGE", "50"))
+
+NOT_FINANCIAL_REPLIES = {
+    "ru": "Ваше сообщение не содержит информации о доходах или расходах.",
+    "uk": "Ваше повідомлення не містить інформації про доходи чи витрати.",
+    "en": "Your message does not contain any income or expense information.",
+}
+
+
+def build_extraction_prompt(categories, default_currency, current_date) -> str:
+    """Системный промпт для одного структурированного запроса к модели."""
+    return f"""
+    Analyze the user's message about income or expenses and return strictly one JSON object with double quotes:
+    {{"is_financial": true, "language": "xx", "transactions": [{{"balance_change": X, "date": "YYYY-MM-DD", "category": "category_name", "currency": "currency_symbol"}}]}}
+    - is_financial: false if the message contains no information about income or expenses (transactions may then be empty).
+    - language: the ISO 639-1 code of the language the user's message is written in.
+    - transactions: one entry per separate income or expense in the message (a receipt or a list like "coffee 50, taxi 120" gives several entries). Do not sum different items into one entry.
+    For each transaction:
+    - balance_change: the change in balance as an integer, negative for expenses and positive for income.
+    - date: the transaction date. If no date is mentioned, try to find it logically in the message. If no date is found, use the current date ({current_date}).
+    - category: one of the user's categories: {categories}. If no category fits, use "{UNCATEGORIZED}". You must use only {categories} or "{UNCATEGORIZED}"!
+    - currency: the currency symbol like USD, EUR, UAH, etc. If no currency is mentioned, use the default currency ({default_currency})."""
+
+
+def normalize_extraction(data, categories, default_currency, current_date) -> dict:
+    """Приводит ответ модели к ожидаемым типам и допустимым значениям.
+
+    Результат: {"is_financial", "language", "transactions": [{balance_change, date, category, currency}]}.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Extraction result is not a JSON object.")
+
+    language = str(data.get("language") or DEFAULT_LANGUAGE).lower()[:2]
+    items = data.get("transactions")
+    if items is None and "balance_change" in data:
+        # Модель вернула одну транзакцию без массива
+        items = [data]
+    if not data.get("is_financial", False) or not isinstance(items, list):
+        return {"is_financial": False, "language": language}
+
+    transactions = [
+        normalize_transaction(item, categories, default_currency, current_date)
+        for item in items[:MAX_TRANSACTIONS_PER_MESSAGE] if isinstance(item, dict)
+    ]
+    if not transactions:
+        return {"is_financial": False, "language": language}
+    return {"is_financial": True, "language": language, "transactions": transactions}
+
+
+def normalize_transaction(data, categories, default_currency, current_date) -> dict:
+    balance_change = int(round(float(data.get("balance_change") or 0)))
+
+    date = data.get("date")
+    try:
+        date = datetime.date.fromisoformat(str(date)).isoformat()
+    except ValueError:
+        date = current_date.isoformat()
+
+    category = data.get("category") or UNCATEGORIZED
+    if category not in categories:
+        category = UNCATEGORIZED
+
+    currency = str(data.get("currency") or default_currency or "USD").upper()
+
+    return {
+        "balance_change": balance_change,
+        "date": date,
+        "category": category,
+        "currency": currency,
+    }
+
+
+async def extract_transaction(user_message, categories, default_currency, current_date) -> dict:
+    """Извлекает данные транзакции из сообщения одним структурированным запросом."""
+    bot_response = await complete(
+        messages=[
+            {"role": "system", "content": build_extraction_prompt(categories, default_currency, current_date)},
+            {"role": "user", "content": user_message}
+        ],
+        response_format={"type": "json_object"},
+    )
+    return normalize_extraction(json.loads(bot_response), categories, default_currency, current_date)
+
+
+def build_batch_extraction_prompt(current_date) -> str:
+    """Системный промпт для пакетного запроса: несколько сообщений разных пользователей."""
+    return f"""
+    You will receive a JSON array of items, each with "id", "message", "categories" and "default_currency".
+    Analyze every item's message independently and return strictly one JSON object with double quotes:
+    {{"results": [{{"id": 0, "is_financial": true, "language": "xx", "transactions": [{{"balance_change": X, "date": "YYYY-MM-DD", "category": "category_name", "currency": "currency_symbol"}}]}}]}}
+    with exactly one result per item and the same "id".
+    - is_financial: false if the message contains no information about income or expenses (transactions may then be empty).
+    - language: the ISO 639-1 code of the language the item's message is written in.
+    - transactions: one entry per separate income or expense in the item's message (a receipt or a list like "coffee 50, taxi 120" gives several entries). Do not sum different items into one entry.
+    For each transaction:
+    - balance_change: the change in balance as an integer, negative for expenses and positive for income.
+    - date: the transaction date. If no date is mentioned, try to find it logically in the message. If no date is found, use the current date ({current_date}).
+    - category: one of the item's own "categories". If no category fits, use "{UNCATEGORIZED}". You must use only the item's categories or "{UNCATEGORIZED}"!
+    - currency: the currency symbol like USD, EUR, UAH, etc. If no currency is mentioned, use the item's "default_currency"."""
+
+
+async def extract_transactions_batch(items, current_date) -> list:
+    """Извлекает данные сразу для нескольких сообщений одним запросом.
+
+    items - список кортежей (user_message, categories, default_currency).
+    Возвращает список той же длины; для элементов, которые модель не вернула или вернула
+    в неверном формате, на месте результата стоит None.
+    """
+    payload = [
+        {"id": i, "message": message, "categories": categories, "default_currency": default_currency}
+        for i, (message, categories, default_currency) in enumerate(items)
+    ]
+    bot_response = await complete(
+        messages=[
+            {"role": "system", "content": build_batch_extraction_prompt(current_date)},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ],
+        response_format={"type": "json_object"},
+    )
+    results = [None] * len(items)
+    for data in json.loads(bot_response).get("results", []):
+        try:
+            i = int(data["id"])
+            _, categories, default_currency = items[i]
+            results[i] = normalize_extraction(data, categories, default_currency, current_date)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed batch extraction result {data}: {e}")
+    return results
+
+
+def format_confirmation(result) -> str:
+    """Formats the confirmation reply from the local per-language templates.
+
+    A single transaction keeps the detailed template; several get one line each plus totals per currency.
+    """
+    language = result.get("language") if result.get("language") in CONFIRMATION_TEMPLATES else DEFAULT_LANGUAGE
+    transactions = result["transactions"]
+    if len(transactions) == 1:
+        return CONFIRMATION_TEMPLATES[language].format(**transactions[0])
+
+    lines = [MULTI_CONFIRMATION_HEADERS[language].format(count=len(transactions))]
+    totals = {}
+    for transaction in transactions:
+        lines.append(
+            f"- {transaction['balance_change']} {transaction['currency']}, "
+            f"{transaction['category']}, {transaction['date']}"
+        )
+        totals[transaction["currency"]] = totals.get(transaction["currency"], 0) + transaction["balance_change"]
+    lines.append(
+        f"{MULTI_CONFIRMATION_TOTALS[language]}: " + ", ".join(f"{total} {currency}" for currency, total in totals.items())
+    )
+    return "\n".join(lines)
+
+
+def format_not_financial(result) -> str:
+    return NOT_FINANCIAL_REPLIES.get(result.get("language"), NOT_FINANCIAL_REPLIES[DEFAULT_LANGUAGE])
@@ -0,0 +1,53 @@
+import os
+import database
+
+# Начиная с этого числа транзакций пользователя текст ищется по FTS5-индексу, а не перебором
+# его строк: индекс выигрывает только у пользователей с длинной историей (см. benchmarks/bench_fts.py)
+FTS_MIN_USER_ROWS = int(os.getenv("FTS_MIN_USER_ROWS", "1000"))
+
+# Условие для WHERE по таблице transactions: совпадение по FTS5-индексу исходного текста сообщения.
+# rowid индекса равен id транзакции, поэтому подзапрос отдаёт готовый набор id без сканирования LIKE.
+MATCH_CONDITION = 'id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)'
+# Перебор строк пользователя; search_words регистрируется в database.connect и нормализует
+# текст так же, как токенизатор индекса, поэтому оба способа находят одни и те же строки
+LIKE_CONDITION = "search_words(message) LIKE ?"
+
+
+def split_words(text) -> list:
+    return database.split_search_words(text)
+
+
+def build_match_query(user_id, text):
+    """Преобразует свободный текст в запрос FTS5 по сообщениям одного пользователя.
+
+    Каждое слово берётся в кавычки (служебные символы FTS5 не интерпретируются) и ищется
+    по префиксу, чтобы "ашан" находил "Ашане". Слова объединяются через AND.
+    Возвращает None, если в тексте нет слов.
+    """
+    words = split_words(text)
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"*' for word in words)
+    user = str(user_id).replace('"', '""')
+    return f'user_id:"{user}" AND message:({terms})'
+
+
+def build_like_patterns(text) -> list:
+    """Шаблоны LIKE для каждого слова текста: слово сообщения, начинающееся с него ("ашан" -> "Ашане")."""
+    return [f'% {word}%' for word in split_words(text)]
+
+
+async def text_condition(user_id, text):
+    """Условие WHERE и параметры для поиска текста в сообщениях пользователя.
+
+    У пользователей с небольшим числом транзакций быстрее перебрать их строки по индексу
+    user_id, у остальных - пересечь индекс FTS5 с токеном пользователя.
+    Возвращает None, если в тексте нет слов.
+    """
+    patterns = build_like_patterns(text)
+    if not patterns:
+        return None
+    (count,) = await database.fetchone('SELECT COUNT(*) FROM transactions WHERE user_id = ?', (str(user_id),))
+    if count >= FTS_MIN_USER_ROWS:
+        return MATCH_CONDITION, [build_match_query(user_id, text)]
+    return ' AND '.join([LIKE_CONDITION] * len(patterns)), patterns
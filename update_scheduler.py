@@ -0,0 +1,110 @@
+import os
+import asyncio
+import logging
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывать одновременно (разные пользователи)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+# Лимит семафора BaseUpdateProcessor: он лишь ограничивает число обновлений в работе,
+# настоящий лимит UPDATE_CONCURRENCY берётся уже после очереди пользователя
+MAX_UPDATES_IN_FLIGHT = int(os.getenv("MAX_UPDATES_IN_FLIGHT", "10000"))
+
+
+class _UserQueue:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0  # обновления пользователя: ожидающие и выполняемое
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей с сохранением порядка для одного.
+
+    Обновления одного пользователя выполняются строго по очереди (asyncio.Lock отдаёт блокировку
+    в порядке ожидания), поэтому машина состояний в context.user_data не получает гонок.
+    Запись о пользователе живёт в словаре только пока у него есть необработанные обновления,
+    так что размер словаря ограничен числом обновлений в работе.
+
+    Очередь пользователя устроена в do_process_update - единственной точке расширения
+    BaseUpdateProcessor (process_update в PTB 21 помечен @final). Семафор базового класса
+    получает большой лимит, а слот из UPDATE_CONCURRENCY занимается уже внутри очереди
+    пользователя: обновления, ждущие своей очереди, слотов не держат, и пачка сообщений
+    одного пользователя не задерживает остальных.
+    """
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY, max_in_flight=MAX_UPDATES_IN_FLIGHT):
+        super().__init__(max(max_in_flight, max_concurrent_updates))
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._users = {}
+        self.active = 0
+        self.queued = 0
+        self.processed = 0
+        self.max_user_depth = 0
+
+    @staticmethod
+    def _user_key(update):
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = self._user_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        # До захвата блокировки не должно быть await - иначе порядок обновлений не гарантирован
+        queue = self._users.get(key)
+        if queue is None:
+            queue = self._users[key] = _UserQueue()
+        queue.pending += 1
+        self.max_user_depth = max(self.max_user_depth, queue.pending)
+        self.queued += 1
+        try:
+            async with queue.lock:
+                self.queued -= 1
+                await self._run(coroutine)
+        finally:
+            queue.pending -= 1
+            if queue.pending == 0:
+                del self._users[key]
+
+    async def _run(self, coroutine) -> None:
+        async with self._slots:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def queue_depths(self, limit=10) -> dict:
+        """Пользователи с самой длинной очередью: user_id -> число необработанных обновлений."""
+        deepest = sorted(self._users.items(), key=lambda item: item[1].pending, reverse=True)[:limit]
+        return {user_id: queue.pending for user_id, queue in deepest}
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "users": len(self._users),
+            "processed": self.processed,
+            "max_user_depth": self.max_user_depth,
+            "queue_depths": self.queue_depths(),
+            "limit": self.limit,
+        }
+
+
+update_processor = PerUserUpdateProcessor()
@@ -0,0 +1,127 @@
+import os
+import json
+import sqlite3
+import logging
+from collections import OrderedDict
+import database
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+
+
+class ProfileRepository:
+    """Профили пользователей (категории и валюта по умолчанию) с LRU-кэшем в памяти.
+
+    Кэш обновляется при каждой записи (write-through); запись пропускается, если профиль
+    не изменился и уже есть в базе. Вызывающий код получает копии и может их изменять.
+    """
+
+    def __init__(self, max_entries=PROFILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        # user_id -> (exists_in_db, categories, default_currency)
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.writes_skipped = 0
+
+    def _remember(self, user_id, exists, categories, default_currency) -> None:
+        self._cache[user_id] = (exists, tuple(categories), default_currency)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _load(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            self._cache.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        row = await database.fetchone('SELECT categories, default_currency FROM user_data WHERE user_id = ?', (user_id,))
+        if row:
+            categories = json.loads(row[0]) if row[0] else []
+            self._remember(user_id, True, categories, row[1])
+        else:
+            self._remember(user_id, False, [], None)
+        return self._cache[user_id]
+
+    async def get(self, user_id) -> dict:
+        _, categories, default_currency = await self._load(user_id)
+        return {
+            "categories": list(categories),
+            "default_currency": default_currency
+        }
+
+    async def save(self, user_id, user_data) -> bool:
+        """Сохраняет профиль. Возвращает False, если запись не понадобилась."""
+        categories = list(user_data.get("categories", []))
+        default_currency = user_data.get("default_currency")
+        exists, cached_categories, cached_currency = await self._load(user_id)
+        if exists and tuple(categories) == cached_categories and default_currency == cached_currency:
+            self.writes_skipped += 1
+            return False
+
+        try:
+            await database.execute('''
+                INSERT INTO user_data (user_id, categories, default_currency)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                categories=excluded.categories,
+                default_currency=excluded.default_currency
+            ''', (user_id, json.dumps(categories), default_currency))
+        except sqlite3.Error as e:
+            logger.error(f"Database error: {e}")
+            self.invalidate(user_id)
+            return False
+        self._remember(user_id, True, categories, default_currency)
+        return True
+
+    async def rename_category(self, user_id, old_category, new_category) -> bool:
+        """Переименовывает категорию в профиле и во всех транзакциях пользователя одной транзакцией."""
+        profile = await self.get(user_id)
+        if old_category not in profile["categories"]:
+            return False
+        categories = profile["categories"]
+        categories[categories.index(old_category)] = new_category
+
+        def rename(conn):
+            conn.execute(
+                'UPDATE user_data SET categories = ? WHERE user_id = ?',
+                (json.dumps(categories), user_id)
+            )
+            conn.execute(
+                "UPDATE transactions SET category = ? WHERE category = ? AND user_id = ?",
+                (new_category, old_category, user_id)
+            )
+
+        try:
+            await database.run(rename)
+        finally:
+            self.invalidate(user_id)
+        return True
+
+    def invalidate(self, user_id) -> None:
+        self._cache.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._cache),
+            "writes_skipped": self.writes_skipped,
+        }
+
+
+profiles = ProfileRepository()
+
+
+async def get_user_data(user_id):
+    return await profiles.get(user_id)
+
+
+async def save_user_data(user_id, user_data):
+    return await profiles.save(user_id, user_data)
@@ -0,0 +1,179 @@
+import os
+import hmac
+import signal
+import asyncio
+import logging
+from aiohttp import web
+from telegram import Update
+from metrics import collect
+
+logger = logging.getLogger(__name__)
+
+# Публичный https-адрес, который регистрируется в Telegram. Без него сервер запускается
+# без setWebhook - так его можно проверять локально, отправляя записанные Update POST-запросом:
+#   curl -X POST -H "Content-Type: application/json" \
+#        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET_TOKEN" \
+#        --data @update.json http://127.0.0.1:8443/telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_HEALTH_PATH = os.getenv("WEBHOOK_HEALTH_PATH", "/health")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# Сертификат и ключ для TLS на самом сервере; сертификат также отправляется в Telegram (нужно для самоподписанного)
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT")
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_DROP_PENDING_UPDATES = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "0") == "1"
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-сервер, принимающий обновления Telegram и передающий их в application.update_queue.
+
+    Помимо пути вебхука отвечает на health-запрос для балансировщика нагрузки.
+    """
+
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 health_path=WEBHOOK_HEALTH_PATH, secret_token=WEBHOOK_SECRET_TOKEN,
+                 cert=WEBHOOK_CERT, key=WEBHOOK_KEY):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.health_path = health_path
+        self.secret_token = secret_token
+        self.cert = cert
+        self.key = key
+        self._runner = None
+        self.received = 0
+        self.rejected = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get(self.health_path, self.handle_health)
+        return app
+
+    def _ssl_context(self):
+        if not (self.cert and self.key):
+            return None
+        import ssl
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.cert, self.key)
+        return context
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token
+        ):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            self.rejected += 1
+            return web.Response(status=400)
+        if update is None:
+            self.rejected += 1
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        running = self.application.running
+        return web.json_response(
+            {
+                "status": "ok" if running else "stopping",
+                "received": self.received,
+                "rejected": self.rejected,
+                "update_queue": self.application.update_queue.qsize(),
+                "metrics": collect(),
+            },
+            status=200 if running else 503
+        )
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port, ssl_context=self._ssl_context())
+        await site.start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def set_webhook(application) -> None:
+    if not WEBHOOK_URL:
+        logger.warning("WEBHOOK_URL is not set, webhook is not registered in Telegram (local mode)")
+        return
+    certificate = open(WEBHOOK_CERT, 'rb') if WEBHOOK_CERT else None
+    try:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL,
+            certificate=certificate,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=WEBHOOK_DROP_PENDING_UPDATES,
+        )
+    finally:
+        if certificate is not None:
+            certificate.close()
+    logger.info(f"Webhook registered: {WEBHOOK_URL}")
+
+
+def _wait_for_stop_signal() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка через KeyboardInterrupt
+            pass
+    return stop
+
+
+async def serve(application) -> None:
+    """Запускает приложение в режиме вебхука в том же порядке, что и run_polling:
+    initialize -> post_init -> start ... stop -> post_stop -> shutdown -> post_shutdown.
+    """
+    # Без секрета любой POST на публичный адрес принимался бы как обновление Telegram
+    if WEBHOOK_URL and not WEBHOOK_SECRET_TOKEN:
+        raise RuntimeError("WEBHOOK_SECRET_TOKEN must be set when WEBHOOK_URL is set")
+    if not WEBHOOK_SECRET_TOKEN:
+        logger.warning("WEBHOOK_SECRET_TOKEN is not set, webhook requests are not authenticated")
+    server = WebhookServer(application)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await set_webhook(application)
+        await application.start()
+        try:
+            await server.start()
+            await _wait_for_stop_signal().wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application) -> None:
+    try:
+        asyncio.run(serve(application))
+    except KeyboardInterrupt:
+        logger.info("Webhook server stopped")